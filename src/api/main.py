@@ -12,7 +12,10 @@ from pydantic import BaseModel, EmailStr
 import asyncio
 import json
 import os
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
 from ..search.query_processor_simple import SimpleQueryProcessor, NGramGenerator
@@ -25,13 +28,20 @@ from ..feed.parser import FeedParser, FeedManager
 from ..feed.scheduler import start_feed_scheduler, stop_feed_scheduler
 from ..billing.scheduler import start_billing_scheduler, stop_billing_scheduler
 from . import email_sender
-from ..core.models import Product
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from ..core.models import ProductBatch
+
+# Настройка логирования: event loop только кладёт записи в очередь,
+# вывод в stdout (с форматом записи) - в фоновом потоке QueueListener
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 )
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # дописать очередь при выходе
+logging.root.setLevel(logging.INFO)
+logging.root.addHandler(QueueHandler(_log_queue))
 logger = logging.getLogger(__name__)
 
 
@@ -145,6 +155,7 @@ async def lifespan(app: FastAPI):
     await stop_billing_scheduler()
 
     # Закрытие соединений
+    await feed_manager.aclose()
     await db.disconnect()
     await redis_client.close()
     print("✓ Connections closed")
@@ -355,32 +366,13 @@ async def background_feed_load(project_id: str, feed_url: str):
         # Сохраняем товары
         await data_store.save_products(project_id, result["products"])
         
-        # Конвертируем и индексируем
-        products_list = []
-        for p in result["products"]:
-            try:
-                product = Product(
-                    id=str(p.get("id", "")),
-                    name=p.get("name", ""),
-                    url=p.get("url", ""),
-                    description=p.get("description"),
-                    image=p.get("image"),
-                    images=p.get("images", []),
-                    price=float(p.get("price", 0) or 0),
-                    old_price=float(p.get("old_price") or 0) if p.get("old_price") else None,
-                    in_stock=p.get("in_stock", True),
-                    category=p.get("category"),
-                    category_id=p.get("category_id"),
-                    brand=p.get("brand"),
-                    vendor_code=p.get("vendor_code"),
-                    params=p.get("params", {}),
-                )
-                products_list.append(product)
-            except Exception as e:
-                logger.error(f"Error converting product {p.get('id')}: {e}")
-                continue
+        # Конвертируем в колоночную пачку и индексируем
+        products_batch = ProductBatch.from_dicts(result["products"])
+        skipped = len(result["products"]) - len(products_batch)
+        if skipped:
+            logger.error(f"Skipped {skipped} products with invalid price for project {project_id}")
         
-        await indexer.index_products(project_id, products_list)
+        await indexer.index_products(project_id, products_batch)
         
         # Готово
         from datetime import datetime
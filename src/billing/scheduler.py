@@ -10,9 +10,12 @@ paid_until=NULL у проекта означает "оплата не отсле
 вообще ни на одном из двух шагов (см. WHERE paid_until IS NOT NULL в DataStore-запросах).
 """
 import asyncio
+import logging
 from datetime import datetime
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 class BillingScheduler:
     """Планировщик проверки окончания оплаченного периода проектов"""
@@ -33,7 +36,7 @@ class BillingScheduler:
 
         self._running = True
         self._task = asyncio.create_task(self._scheduler_loop())
-        print(f"✓ Billing scheduler started (check every {self.CHECK_INTERVAL_MINUTES}m)")
+        logger.info("Billing scheduler started (check every %sm)", self.CHECK_INTERVAL_MINUTES)
 
     async def stop(self):
         """Остановка планировщика"""
@@ -44,7 +47,7 @@ class BillingScheduler:
                 await self._task
             except asyncio.CancelledError:
                 pass
-        print("✓ Billing scheduler stopped")
+        logger.info("Billing scheduler stopped")
 
     async def _scheduler_loop(self):
         """Основной цикл планировщика"""
@@ -54,7 +57,7 @@ class BillingScheduler:
             try:
                 await self._check_billing()
             except Exception as e:
-                print(f"[BillingScheduler] error: {e}")
+                logger.error("[BillingScheduler] error: %s", e)
 
             await asyncio.sleep(self.CHECK_INTERVAL_MINUTES * 60)
 
@@ -72,9 +75,9 @@ class BillingScheduler:
                     f"Проект «{project['name']}» истекает {project['paid_until']}",
                     project_id=project["id"]
                 )
-                print(f"[BillingScheduler] expiry warning sent for {project['id']}")
+                logger.info("[BillingScheduler] expiry warning sent for %s", project["id"])
             except Exception as e:
-                print(f"[BillingScheduler] failed to warn {project.get('id')}: {e}")
+                logger.error("[BillingScheduler] failed to warn %s: %s", project.get("id"), e)
 
         to_suspend = await self.data_store.get_projects_to_suspend(today)
         for project in to_suspend:
@@ -86,9 +89,9 @@ class BillingScheduler:
                     f"Проект «{project['name']}» приостановлен (не оплачен)",
                     project_id=project["id"]
                 )
-                print(f"[BillingScheduler] suspended {project['id']} (paid_until {project['paid_until']})")
+                logger.info("[BillingScheduler] suspended %s (paid_until %s)", project["id"], project["paid_until"])
             except Exception as e:
-                print(f"[BillingScheduler] failed to suspend {project.get('id')}: {e}")
+                logger.error("[BillingScheduler] failed to suspend %s: %s", project.get("id"), e)
 
 
 # Глобальный экземпляр
@@ -6,6 +6,7 @@ from .models import (
     Project,
     Feed,
     Product,
+    ProductBatch,
     SearchQuery,
     SearchResult,
     Suggestion,
@@ -39,6 +40,7 @@ __all__ = [
     "Project",
     "Feed",
     "Product",
+    "ProductBatch",
     "SearchQuery",
     "SearchResult",
     "Suggestion",
@@ -2,9 +2,9 @@
 Интерфейсы (абстрактные классы) сервиса поиска
 """
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Union, AsyncIterator
 from .models import (
-    Product, SearchResult, SuggestResult, SearchQuery,
+    Product, ProductBatch, SearchResult, SuggestResult, SearchQuery,
     Feed, FeedLog, Project, Synonym
 )
 
@@ -116,9 +116,27 @@ class IQueryProcessor(ABC):
         """Исправить опечатки"""
         pass
     
+    @abstractmethod
+    def build_dictionary(self, project_id: str, tokens: Iterable[str]) -> None:
+        """
+        Построить словарь для исправления опечаток
+
+        Вызывается индексатором при индексации товаров проекта - тяжёлая
+        подготовка словаря делается один раз, а не на каждый запрос.
+        """
+        pass
+    
     @abstractmethod
     def expand_synonyms(self, tokens: List[str], project_id: str) -> List[List[str]]:
-        """Расширить синонимами"""
+        """
+        Расширить синонимами
+
+        Returns:
+            По группе на токен запроса: [токен, синоним1, ...]. Группы
+            применяются как AND из OR (внутри группы - любой вариант);
+            декартово произведение вариантов не строится - размер
+            результата линеен по числу токенов и синонимов.
+        """
         pass
 
 
@@ -129,11 +147,15 @@ class IIndexer(ABC):
     async def index_products(
         self,
         project_id: str,
-        products: List[Product]
+        products: Union[ProductBatch, List[Product]]
     ) -> int:
         """
         Индексировать товары (полная переиндексация)
         
+        Args:
+            products: Список Product или ProductBatch (колоночная пачка,
+                при итерации отдаёт Product по одному)
+        
         Returns:
             Количество проиндексированных товаров
         """
@@ -387,6 +409,18 @@ class IFeedRepository(ABC):
         """Получить фиды, требующие обновления"""
         pass
     
+    async def iter_pending_feeds(self) -> AsyncIterator[Feed]:
+        """
+        Фиды, требующие обновления, по одному
+        
+        Для больших каталогов фидов реализация переопределяет метод
+        серверным курсором, чтобы не строить весь список в памяти и
+        начинать обработку до конца выборки. По умолчанию - поверх
+        get_pending_feeds.
+        """
+        for feed in await self.get_pending_feeds():
+            yield feed
+    
     @abstractmethod
     async def create(self, feed: Feed) -> Feed:
         pass
@@ -1,12 +1,22 @@
 """
 Модели данных для сервиса поиска
 """
+import time
+from array import array
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator
 from enum import Enum
 
 
+def _now_ts() -> int:
+    """
+    Текущее время (unix timestamp, секунды) для моделей, которые
+    создаются массово - дешевле, чем datetime.now()
+    """
+    return int(time.time())
+
+
 class FeedType(Enum):
     FULL = "full"
     DELTA = "delta"
@@ -31,7 +41,7 @@ class ProjectStatus(Enum):
     DELETED = "deleted"
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     """Пользователь системы"""
     id: str
@@ -41,7 +51,7 @@ class User:
     created_at: datetime = field(default_factory=datetime.now)
 
 
-@dataclass
+@dataclass(slots=True)
 class Project:
     """Проект (сайт клиента)"""
     id: str
@@ -71,7 +81,7 @@ class Project:
     }
 
 
-@dataclass
+@dataclass(slots=True)
 class Feed:
     """Фид товаров"""
     id: str
@@ -87,7 +97,7 @@ class Feed:
     created_at: datetime = field(default_factory=datetime.now)
 
 
-@dataclass
+@dataclass(slots=True)
 class Product:
     """Товар в индексе"""
     id: str
@@ -118,12 +128,103 @@ class Product:
     popularity: float = 0.0
     
     def __post_init__(self):
-        # Вычисляем скидку
-        if self.old_price and self.price and self.old_price > self.price:
-            self.discount_percent = round((1 - self.price / self.old_price) * 100)
+        # Вычисляем скидку; у большинства товаров старой цены нет, поэтому
+        # сначала дешёвая проверка на None
+        old_price = self.old_price
+        if old_price is not None and old_price > self.price > 0:
+            self.discount_percent = round((1 - self.price / old_price) * 100)
+
+
+class ProductBatch:
+    """
+    Пачка товаров для индексации в колоночном виде (по списку на поле)
 
+    Вместо сотен тысяч объектов Product в памяти держатся только колонки;
+    при итерации Product собирается на лету по одному, так что код,
+    работающий со списком Product, принимает пачку без изменений.
+    """
+    
+    __slots__ = (
+        "ids", "names", "urls", "descriptions", "images", "images_lists",
+        "prices", "old_prices", "in_stock", "categories", "category_ids",
+        "brands", "vendor_codes", "params",
+    )
+    
+    def __init__(self):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.urls: List[str] = []
+        self.descriptions: List[Optional[str]] = []
+        self.images: List[Optional[str]] = []
+        self.images_lists: List[List[str]] = []
+        self.prices = array("d")
+        self.old_prices: List[Optional[float]] = []
+        self.in_stock = bytearray()
+        self.categories: List[Optional[str]] = []
+        self.category_ids: List[Optional[str]] = []
+        self.brands: List[Optional[str]] = []
+        self.vendor_codes: List[Optional[str]] = []
+        self.params: List[Dict[str, str]] = []
+    
+    @classmethod
+    def from_dicts(cls, dicts: Iterable[Dict[str, Any]]) -> "ProductBatch":
+        """
+        Заполнение колонок за один проход по товарам из фида
 
-@dataclass
+        Товары с некорректной ценой пропускаются.
+        """
+        batch = cls()
+        for p in dicts:
+            try:
+                price = float(p.get("price", 0) or 0)
+                old_price = float(p.get("old_price") or 0) if p.get("old_price") else None
+            except (TypeError, ValueError):
+                continue
+            
+            batch.ids.append(str(p.get("id", "")))
+            batch.names.append(p.get("name", ""))
+            batch.urls.append(p.get("url", ""))
+            batch.descriptions.append(p.get("description"))
+            batch.images.append(p.get("image"))
+            # Дефолт создаём только при отсутствии ключа: p.get("images", [])
+            # строил бы пустой список на каждую строку
+            images = p.get("images")
+            batch.images_lists.append(images if images is not None else [])
+            batch.prices.append(price)
+            batch.old_prices.append(old_price)
+            batch.in_stock.append(1 if p.get("in_stock", True) else 0)
+            batch.categories.append(p.get("category"))
+            batch.category_ids.append(p.get("category_id"))
+            batch.brands.append(p.get("brand"))
+            batch.vendor_codes.append(p.get("vendor_code"))
+            params = p.get("params")
+            batch.params.append(params if params is not None else {})
+        return batch
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __iter__(self) -> Iterator["Product"]:
+        for i in range(len(self.ids)):
+            yield Product(
+                id=self.ids[i],
+                name=self.names[i],
+                url=self.urls[i],
+                description=self.descriptions[i],
+                image=self.images[i],
+                images=self.images_lists[i],
+                price=self.prices[i],
+                old_price=self.old_prices[i],
+                in_stock=bool(self.in_stock[i]),
+                category=self.categories[i],
+                category_id=self.category_ids[i],
+                brand=self.brands[i],
+                vendor_code=self.vendor_codes[i],
+                params=self.params[i],
+            )
+
+
+@dataclass(slots=True)
 class SearchQuery:
     """Поисковый запрос"""
     raw_query: str
@@ -133,7 +234,7 @@ class SearchQuery:
     original_query: Optional[str] = None  # если была коррекция
 
 
-@dataclass
+@dataclass(slots=True)
 class SearchResult:
     """Результат поиска"""
     query: str
@@ -145,7 +246,7 @@ class SearchResult:
     corrected_query: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Suggestion:
     """Подсказка"""
     text: str
@@ -154,7 +255,7 @@ class Suggestion:
     type: str = "query"  # query, category, product
 
 
-@dataclass
+@dataclass(slots=True)
 class SuggestResult:
     """Результат подсказок"""
     prefix: str
@@ -164,7 +265,7 @@ class SuggestResult:
     took_ms: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Synonym:
     """Синоним"""
     id: str
@@ -173,7 +274,7 @@ class Synonym:
     synonyms: List[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class SearchStats:
     """Статистика поискового запроса"""
     id: str
@@ -183,10 +284,14 @@ class SearchStats:
     clicked_product_id: Optional[str] = None
     click_position: Optional[int] = None
     session_id: Optional[str] = None
-    created_at: datetime = field(default_factory=datetime.now)
+    created_at: int = field(default_factory=_now_ts)  # unix timestamp
+    
+    @property
+    def created_at_iso(self) -> str:
+        return datetime.fromtimestamp(self.created_at).isoformat()
 
 
-@dataclass
+@dataclass(slots=True)
 class FeedLog:
     """Лог обработки фида"""
     id: str
@@ -199,4 +304,8 @@ class FeedLog:
     errors_count: int = 0
     duration_ms: int = 0
     error_message: Optional[str] = None
-    created_at: datetime = field(default_factory=datetime.now)
+    created_at: int = field(default_factory=_now_ts)  # unix timestamp
+    
+    @property
+    def created_at_iso(self) -> str:
+        return datetime.fromtimestamp(self.created_at).isoformat()
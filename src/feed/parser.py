@@ -2,13 +2,59 @@
 Парсер XML фидов товаров (YML формат - Яндекс.Маркет)
 Поддерживает фиды типа lm-shop.ru/feed_search.xml
 """
+import hashlib
 import html
-import xml.etree.ElementTree as ET
-from typing import List, Dict, Any, Optional
+import io
+import logging
+import mmap
+import os
+import re
+import sys
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree as ET
+from typing import List, Dict, Any, Optional, Tuple, IO, Iterable, Iterator, AsyncIterator, Union
 import aiohttp
 import asyncio
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Размер чанка при скачивании фида
+FETCH_CHUNK_SIZE = 64 * 1024
+# До этого размера фид держим в памяти, дальше SpooledTemporaryFile уходит на диск
+FETCH_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+# Фиды больше этого размера разбираются параллельно в пуле процессов
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+# Количество offer в одной задаче для процесса-воркера
+PARALLEL_BATCH_SIZE = 5000
+# Сколько скачанных чанков может ждать потока разбора при потоковом парсинге
+STREAM_QUEUE_SIZE = 8
+
+# Заголовки запроса фида: сжатие (aiohttp сам распаковывает ответ) и
+# узнаваемый User-Agent
+FEED_REQUEST_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "rozmuar-search/1.0",
+}
+
+# Теги, по которым потоковый парсер отдаёт события
+_STREAM_TAGS = ("offer", "category", "shop")
+
+_XML_DECLARATION_RE = re.compile(rb"^\s*(<\?xml[^>]*\?>)")
+# Разметка, значимая для нарезки offers: CDATA и комментарии пропускаются
+# целиком (внутри них </offer> - просто текст), открывающий тег offer
+# (в том числе самозакрывающийся) и закрывающий </offer>
+_OFFER_MARKUP_RE = re.compile(
+    rb"<!\[CDATA\[.*?\]\]>"
+    rb"|<!--.*?-->"
+    rb"|<offer(?=[\s/>])(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"
+    rb"|</offer\s*>",
+    re.S
+)
+
 
 def _unescape(text: Optional[str]) -> str:
     """Декодирует HTML-сущности (&quot; и т.п.), которые остаются буквальным
@@ -17,90 +63,518 @@ def _unescape(text: Optional[str]) -> str:
     return html.unescape(text) if text else (text or "")
 
 
+def _release(elem) -> None:
+    """Освобождает уже разобранный элемент и его предыдущих соседей,
+    чтобы дерево не росло по мере чтения фида"""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _category(elem) -> Dict[str, Any]:
+    """Категория фида; id и name интернируются - товары категории
+    ссылаются на одни и те же строки"""
+    return {
+        "id": sys.intern(elem.get("id") or ""),
+        "name": sys.intern(_unescape(elem.text or "")),
+        "parent_id": elem.get("parentId")
+    }
+
+
+# Текстовые дочерние теги offer: собираются за один проход по детям
+# вместо findtext на каждое поле
+_OFFER_TEXT_TAGS = frozenset((
+    "name", "typePrefix", "vendor", "model", "price", "oldprice",
+    "currencyId", "categoryId", "url", "description", "vendorCode",
+))
+
+
+# Категории фида в процессе-воркере (передаются один раз через initializer)
+_worker_categories: Dict[str, Dict] = {}
+
+
+def _init_offer_worker(categories: Dict[str, Dict]) -> None:
+    global _worker_categories
+    _worker_categories = categories
+
+
+def _parse_offer_chunk(xml_chunk: bytes) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """Разбор пачки offer в процессе-воркере: (товары, число ошибочных offer);
+    None, если пачка не разбирается как XML"""
+    try:
+        root = ET.fromstring(xml_chunk, parser=ET.XMLParser(huge_tree=True))
+    except ET.XMLSyntaxError:
+        return None
+    products = []
+    errors = 0
+    for offer in root:
+        if offer.tag == "offer":
+            product = FeedParser._parse_offer(offer, _worker_categories)
+            if product:
+                products.append(product)
+            else:
+                errors += 1
+    return products, errors
+
+
+def _split_offers(data: bytes, batch_size: int) -> Iterator[bytes]:
+    """
+    Нарезает тело фида на самостоятельные XML-документы по batch_size offer
+
+    Границы offer ищутся по байтам, без построения дерева: учитываются
+    самозакрывающиеся <offer .../>, а CDATA и комментарии пропускаются,
+    чтобы </offer> в тексте описания не резал offer. К каждому куску
+    добавляется исходная XML-декларация, чтобы сохранить кодировку фида.
+    """
+    match = _XML_DECLARATION_RE.match(data)
+    declaration = match.group(1) if match else b""
+    
+    count = 0
+    batch_start = -1
+    offer_start = -1
+    end = 0
+    for markup in _OFFER_MARKUP_RE.finditer(data):
+        token = markup.group()
+        if token.startswith(b"<!"):
+            continue
+        if token.startswith(b"</"):
+            if offer_start == -1:
+                continue
+        elif offer_start == -1:
+            offer_start = markup.start()
+            if not token.endswith(b"/>"):
+                continue
+        else:
+            # Вложенных offer в YML нет
+            continue
+        
+        if batch_start == -1:
+            batch_start = offer_start
+        offer_start = -1
+        end = markup.end()
+        count += 1
+        if count == batch_size:
+            yield declaration + b"<offers>" + data[batch_start:end] + b"</offers>"
+            batch_start = -1
+            count = 0
+    
+    if batch_start != -1:
+        yield declaration + b"<offers>" + data[batch_start:end] + b"</offers>"
+
+
 class FeedParser:
-    """Парсер XML фидов товаров"""
+    """
+    Парсер XML фидов товаров
+
+    Загрузка (stream_feed, load_and_parse) идёт через одну ClientSession
+    на экземпляр: пул соединений и DNS-кеш переиспользуются между фидами.
+    По завершении работы экземпляр закрывается через aclose().
+    """
+    
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _client(self) -> aiohttp.ClientSession:
+        """Общая сессия, создаётся при первой загрузке"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=50,
+                    ttl_dns_cache=300,
+                    # Короткий keep-alive: простаивающие между проверками
+                    # планировщика соединения не доживают до протухания
+                    keepalive_timeout=30
+                )
+            )
+        return self._session
+    
+    async def aclose(self) -> None:
+        """Закрытие сессии"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    @staticmethod
+    def _get(
+        session: aiohttp.ClientSession,
+        url: str,
+        timeout: int,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        return session.get(
+            url, 
+            headers={**FEED_REQUEST_HEADERS, **(headers or {})},
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            allow_redirects=True,
+            max_redirects=10
+        )
     
     @staticmethod
-    async def fetch_feed(url: str, timeout: int = 300) -> str:
-        """Загрузка фида по URL (таймаут 5 минут для больших фидов)"""
-        connector = aiohttp.TCPConnector(force_close=True)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.get(
-                url, 
-                timeout=aiohttp.ClientTimeout(total=timeout),
-                allow_redirects=True,
-                max_redirects=10
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to fetch feed: HTTP {response.status}")
-                return await response.text()
+    def _check_response(response: aiohttp.ClientResponse) -> None:
+        if response.status != 200:
+            raise Exception(f"Failed to fetch feed: HTTP {response.status}")
     
     @staticmethod
-    def parse_yml(xml_content: str) -> Dict[str, Any]:
+    def _content_digest():
+        """Хеш содержимого фида - для пропуска разбора неизменённого фида"""
+        return hashlib.blake2b(digest_size=16)
+    
+    @staticmethod
+    async def _hash_chunks(chunks: AsyncIterator[bytes], digest) -> AsyncIterator[bytes]:
+        """Пропускает чанки дальше, попутно обновляя digest"""
+        async for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+    
+    @staticmethod
+    async def _spool(response: aiohttp.ClientResponse, digest=None) -> IO[bytes]:
         """
-        Парсинг YML (Яндекс.Маркет) фида
-        Возвращает dict с информацией о магазине и списком товаров
+        Скачивает тело ответа во временный файл, перемотанный на начало
+
+        Если передан digest, он обновляется по ходу скачивания.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=FETCH_SPOOL_MAX_SIZE)
+        try:
+            async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                buffer.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+        except BaseException:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        return buffer
+    
+    async def stream_feed(self, url: str, timeout: int = 300) -> AsyncIterator[bytes]:
+        """Загрузка фида по URL чанками, без буферизации всего тела"""
+        async with FeedParser._get(self._client(), url, timeout) as response:
+            FeedParser._check_response(response)
+            async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                yield chunk
+    
+    @staticmethod
+    def _handle_events(
+        events: Iterable,
+        shop: Dict[str, Any],
+        categories: Dict[str, Dict],
+        stats: Optional[Dict[str, int]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Обработка событий end для offer/category/shop
+
+        Если передан stats, в stats["errors_count"] считаются offer,
+        которые не удалось разобрать.
         """
-        root = ET.fromstring(xml_content)
+        for _, elem in events:
+            tag = elem.tag
+            
+            if tag == "offer":
+                product = FeedParser._parse_offer(elem, categories)
+                _release(elem)
+                if product:
+                    yield product
+                elif stats is not None:
+                    stats["errors_count"] = stats.get("errors_count", 0) + 1
+            
+            elif tag == "category":
+                category = _category(elem)
+                categories[category["id"]] = category
+                _release(elem)
+            
+            else:
+                # Информация о магазине
+                shop["name"] = _unescape(elem.findtext("name", ""))
+                shop["company"] = _unescape(elem.findtext("company", ""))
+                shop["url"] = elem.findtext("url", "")
+    
+    @staticmethod
+    def iter_offers(
+        source: Union[IO[bytes], bytes, str],
+        shop: Dict[str, Any],
+        categories: Dict[str, Dict],
+        stats: Optional[Dict[str, int]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковый парсинг YML (Яндекс.Маркет) фида
+
+        Отдаёт товары по одному; categories заполняются по ходу чтения
+        (в YML категории идут раньше offers, поэтому к моменту разбора
+        товара его категория уже известна), shop - по закрывающему </shop>.
+        В памяти держится только текущий offer - разобранные элементы
+        сразу освобождаются.
+
+        Фильтр tag= отрабатывает внутри libxml2, поэтому в Python-цикл
+        попадает ровно одно событие на offer/category - вложенные теги
+        (name, url, picture, ...) до интерпретатора не доходят.
+        """
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        
+        context = ET.iterparse(
+            source,
+            events=("end",),
+            tag=_STREAM_TAGS,
+            huge_tree=True
+        )
         
+        yield from FeedParser._handle_events(context, shop, categories, stats)
+    
+    @staticmethod
+    def _parse_stream(
+        next_chunk,
+        emit,
+        shop: Dict[str, Any],
+        categories: Dict[str, Dict],
+        stats: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        Разбор чанков в потоке для parse_yml_stream
+
+        next_chunk() блокируется до следующего чанка (None - конец), emit()
+        получает список товаров по каждому чанку, исключение разбора или
+        None в конце. После ошибки чанки дочитываются до None, чтобы
+        отправитель не завис на полной очереди.
+        """
+        try:
+            parser = ET.XMLPullParser(events=("end",), tag=_STREAM_TAGS, huge_tree=True)
+            for chunk in iter(next_chunk, None):
+                parser.feed(chunk)
+                emit(list(FeedParser._handle_events(parser.read_events(), shop, categories, stats)))
+            parser.close()
+            emit(list(FeedParser._handle_events(parser.read_events(), shop, categories, stats)))
+        except Exception as e:
+            emit(e)
+            while next_chunk() is not None:
+                pass
+            return
+        emit(None)
+    
+    @staticmethod
+    async def parse_yml_stream(
+        chunks: AsyncIterator[bytes],
+        shop: Dict[str, Any],
+        categories: Dict[str, Dict],
+        stats: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый парсинг YML по мере скачивания
+
+        Чанки через очередь на STREAM_QUEUE_SIZE уходят в отдельный поток,
+        где их разбирает XMLPullParser; товары возвращаются по мере
+        готовности - загрузка по сети и разбор идут внахлёст. Парсинг не
+        выполняется в event loop: если aiohttp отдаёт уже буферизованные
+        данные без переключения, цикл лишь складывает их в очередь, а на
+        полной очереди уступает управление.
+        """
+        loop = asyncio.get_running_loop()
+        pending: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        parsed: asyncio.Queue = asyncio.Queue()
+        
+        def next_chunk() -> Optional[bytes]:
+            return asyncio.run_coroutine_threadsafe(pending.get(), loop).result()
+        
+        def emit(batch) -> None:
+            loop.call_soon_threadsafe(parsed.put_nowait, batch)
+        
+        def take(batch) -> List[Dict[str, Any]]:
+            if isinstance(batch, Exception):
+                raise batch
+            return batch
+        
+        worker = asyncio.ensure_future(asyncio.to_thread(
+            FeedParser._parse_stream, next_chunk, emit, shop, categories, stats
+        ))
+        try:
+            async for chunk in chunks:
+                await pending.put(chunk)
+                while not parsed.empty():
+                    for product in take(parsed.get_nowait()):
+                        yield product
+            
+            await pending.put(None)
+            while True:
+                batch = await parsed.get()
+                if batch is None:
+                    break
+                for product in take(batch):
+                    yield product
+            await worker
+        finally:
+            # Ошибка загрузки или брошенный генератор: поток дочитывает
+            # очередь до None и завершается
+            if not worker.done():
+                while not pending.empty():
+                    pending.get_nowait()
+                pending.put_nowait(None)
+    
+    @staticmethod
+    def parse_yml(source: Union[IO[bytes], bytes, str]) -> Dict[str, Any]:
+        """
+        Парсинг YML (Яндекс.Маркет) фида
+        Возвращает dict с информацией о магазине, списком товаров и
+        числом пропущенных из-за ошибок offer (errors_count)
+        """
         result = {
             "shop": {},
             "categories": {},
-            "products": []
+            "products": [],
+            "errors_count": 0
         }
         
-        # Информация о магазине
-        shop = root.find(".//shop")
-        if shop is not None:
-            result["shop"] = {
-                "name": _unescape(shop.findtext("name", "")),
-                "company": _unescape(shop.findtext("company", "")),
-                "url": shop.findtext("url", ""),
-            }
+        result["products"] = list(
+            FeedParser.iter_offers(source, result["shop"], result["categories"], result)
+        )
+        
+        return result
+    
+    @staticmethod
+    def parse_yml_parallel(
+        source: IO[bytes],
+        workers: Optional[int] = None,
+        batch_size: int = PARALLEL_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Парсинг большого YML фида в пуле процессов
 
-        # Категории
-        categories = root.findall(".//category")
-        for cat in categories:
-            cat_id = cat.get("id")
-            parent_id = cat.get("parentId")
-            result["categories"][cat_id] = {
-                "id": cat_id,
-                "name": _unescape(cat.text or ""),
-                "parent_id": parent_id
-            }
+        Сначала потоково читаются магазин и категории (до </categories>),
+        затем offers нарезаются по байтовым границам на пачки и
+        разбираются в отдельных процессах - offers независимы друг от
+        друга, а разбор упирается в CPU и GIL. Порядок товаров сохраняется.
+        """
+        result = {
+            "shop": {},
+            "categories": {},
+            "products": [],
+            "errors_count": 0
+        }
         
-        # Товары (offers)
-        offers = root.findall(".//offer")
-        for offer in offers:
-            product = FeedParser._parse_offer(offer, result["categories"])
-            if product:
-                result["products"].append(product)
+        for _, elem in ET.iterparse(
+            source,
+            events=("end",),
+            tag=("category", "categories"),
+            huge_tree=True
+        ):
+            if elem.tag == "category":
+                category = _category(elem)
+                result["categories"][category["id"]] = category
+                continue
+            
+            shop = elem.getparent()
+            if shop is not None and shop.tag == "shop":
+                result["shop"] = {
+                    "name": _unescape(shop.findtext("name", "")),
+                    "company": _unescape(shop.findtext("company", "")),
+                    "url": shop.findtext("url", ""),
+                }
+            break
         
-        return result
+        # Файл фида отображается в память, а не читается целиком: пачки
+        # нарезаются срезами отображения, и в памяти процесса держатся
+        # только пачки, ещё не отданные воркерам
+        source.seek(0)
+        try:
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # Источник без файла (BytesIO) или пустой файл
+            data = source.read()
+        
+        max_workers = workers or os.cpu_count() or 1
+        chunks = _split_offers(data, batch_size)
+        broken = False
+        try:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_offer_worker,
+                initargs=(result["categories"],)
+            ) as executor:
+                # executor.map отправил бы все пачки сразу - держим в работе
+                # не больше двух на воркер, порядок товаров сохраняется
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(executor.submit(_parse_offer_chunk, chunk))
+                    if len(in_flight) < max_workers * 2:
+                        continue
+                    if not FeedParser._collect_chunk(in_flight.popleft().result(), result):
+                        broken = True
+                        break
+                while in_flight and not broken:
+                    if not FeedParser._collect_chunk(in_flight.popleft().result(), result):
+                        broken = True
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            chunks.close()
+            if isinstance(data, mmap.mmap):
+                data.close()
+        
+        if not broken:
+            return result
+        
+        # Нарезка по байтам не совпала с разметкой фида - разбираем целиком
+        logger.warning("[FeedParser] offer chunk is not valid XML, falling back to parse_yml")
+        source.seek(0)
+        return FeedParser.parse_yml(source)
+    
+    @staticmethod
+    def _collect_chunk(
+        chunk_result: Optional[Tuple[List[Dict[str, Any]], int]],
+        result: Dict[str, Any]
+    ) -> bool:
+        """Добавляет в result разобранную пачку; False - пачка не разобралась"""
+        if chunk_result is None:
+            return False
+        products, errors = chunk_result
+        result["products"].extend(products)
+        result["errors_count"] += errors
+        return True
     
     @staticmethod
-    def _parse_offer(offer: ET.Element, categories: Dict) -> Optional[Dict[str, Any]]:
-        """Парсинг одного товара (offer)"""
+    def _parse_offer(offer: ET._Element, categories: Dict) -> Optional[Dict[str, Any]]:
+        """Парсинг одного товара (offer) за один проход по дочерним элементам"""
         try:
             offer_id = offer.get("id", "")
             available = offer.get("available", "true").lower() == "true"
             
+            # Ветвление по тегу прямо в цикле, на локальных переменных -
+            # без вызова обработчика на каждый дочерний элемент
+            fields = {}
+            pictures = []
+            params = {}
+            for child in offer:
+                tag = child.tag
+                if tag in _OFFER_TEXT_TAGS:
+                    # Как и findtext, берётся первое вхождение
+                    if tag not in fields:
+                        fields[tag] = child.text or ""
+                elif tag == "picture":
+                    if child.text:
+                        pictures.append(child.text)
+                elif tag == "param":
+                    param_name = _unescape(child.get("name", ""))
+                    if param_name:
+                        params[param_name] = _unescape(child.text or "")
+            
             # Основные поля
-            name = _unescape(offer.findtext("name", ""))
+            name = _unescape(fields.get("name", ""))
             if not name:
                 # Альтернативный формат: typePrefix + vendor + model
-                type_prefix = _unescape(offer.findtext("typePrefix", ""))
-                vendor = _unescape(offer.findtext("vendor", ""))
-                model = _unescape(offer.findtext("model", ""))
+                type_prefix = _unescape(fields.get("typePrefix", ""))
+                vendor = _unescape(fields.get("vendor", ""))
+                model = _unescape(fields.get("model", ""))
                 name = " ".join(filter(None, [type_prefix, vendor, model]))
             
-            price_text = offer.findtext("price", "0")
+            price_text = fields.get("price", "0")
             try:
                 price = float(price_text)
             except ValueError:
                 price = 0
             
-            old_price_text = offer.findtext("oldprice", "")
+            old_price_text = fields.get("oldprice", "")
             old_price = None
             if old_price_text:
                 try:
@@ -108,40 +582,29 @@ class FeedParser:
                 except ValueError:
                     pass
             
-            currency = offer.findtext("currencyId", "RUB")
+            currency = fields.get("currencyId", "RUB")
             
             # Категория
-            category_id = offer.findtext("categoryId", "")
+            category_id = fields.get("categoryId", "")
             category_name = ""
-            if category_id and category_id in categories:
-                category_name = categories[category_id].get("name", "")
-            
-            # URL и изображения
-            url = offer.findtext("url", "")
+            category = categories.get(category_id) if category_id else None
+            if category is not None:
+                # Строки из категории, а не копии из offer - одни на всю категорию
+                category_id = category["id"]
+                category_name = category.get("name", "")
             
-            # Может быть несколько картинок
-            pictures = []
-            for pic in offer.findall("picture"):
-                if pic.text:
-                    pictures.append(pic.text)
+            # URL и изображения (картинок может быть несколько)
+            url = fields.get("url", "")
             
             # Описание
-            description = _unescape(offer.findtext("description", ""))
+            description = _unescape(fields.get("description", ""))
 
             # Vendor / Brand
-            vendor = _unescape(offer.findtext("vendor", ""))
+            vendor = _unescape(fields.get("vendor", ""))
 
             # Артикул
-            vendor_code = _unescape(offer.findtext("vendorCode", ""))
+            vendor_code = _unescape(fields.get("vendorCode", ""))
 
-            # Параметры товара
-            params = {}
-            for param in offer.findall("param"):
-                param_name = _unescape(param.get("name", ""))
-                param_value = _unescape(param.text or "")
-                if param_name:
-                    params[param_name] = param_value
-            
             return {
                 "id": offer_id,
                 "name": name,
@@ -160,17 +623,92 @@ class FeedParser:
                 "params": params
             }
         except Exception as e:
-            print(f"Error parsing offer: {e}")
+            # Ошибки по отдельным offer не логируем на уровне INFO - в битом
+            # фиде их тысячи; итоговое число считают вызывающие (errors_count)
+            logger.debug("Error parsing offer %s: %s", offer.get("id"), e)
             return None
     
-    @staticmethod
-    async def load_and_parse(url: str) -> Dict[str, Any]:
-        """Загрузка и парсинг фида"""
-        xml_content = await FeedParser.fetch_feed(url)
-        # Парсинг XML - CPU-bound, выносим в отдельный поток чтобы не
-        # блокировать event loop (иначе весь сервер перестаёт отвечать
-        # на другие запросы на время парсинга большого фида)
-        return await asyncio.to_thread(FeedParser.parse_yml, xml_content)
+    async def load_and_parse(
+        self,
+        url: str,
+        timeout: int = 300,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Загрузка и парсинг фида
+
+        Обычные фиды разбираются на лету, по мере скачивания, в отдельном
+        потоке (parse_yml_stream). Большие
+        (по Content-Length) сначала скачиваются во временный файл и
+        разбираются в пуле процессов.
+
+        Если переданы etag/last_modified от прошлой загрузки, запрос
+        условный: на 304 Not Modified возвращается {"unchanged": True}
+        без скачивания и разбора. Валидаторы текущего ответа кладутся в
+        результат ("etag", "last_modified") для следующей загрузки.
+
+        content_hash - хеш содержимого прошлой загрузки (результат кладёт
+        текущий в "content_hash"). Если он передан, тело сначала
+        скачивается во временный файл, и при совпадении хеша разбор
+        пропускается - это покрывает серверы без ETag/Last-Modified.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        
+        async with FeedParser._get(self._client(), url, timeout, headers) as response:
+            if response.status == 304 and headers:
+                return {"unchanged": True}
+            FeedParser._check_response(response)
+            
+            validators = {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+            digest = FeedParser._content_digest()
+            
+            parallel = (
+                (response.content_length or 0) >= PARALLEL_MIN_SIZE
+                and (os.cpu_count() or 1) > 1
+            )
+            if parallel or content_hash:
+                feed_file = await FeedParser._spool(response, digest)
+                try:
+                    validators["content_hash"] = digest.hexdigest()
+                    if validators["content_hash"] == content_hash:
+                        return {"unchanged": True, **validators}
+                    # Парсинг XML - CPU-bound, выносим из event loop (иначе
+                    # весь сервер перестаёт отвечать на другие запросы на
+                    # время парсинга большого фида)
+                    parse = FeedParser.parse_yml_parallel if parallel else FeedParser.parse_yml
+                    result = await asyncio.to_thread(parse, feed_file)
+                finally:
+                    feed_file.close()
+                result.update(validators)
+                return result
+            
+            result = {
+                "shop": {},
+                "categories": {},
+                "products": [],
+                "errors_count": 0,
+                **validators
+            }
+            
+            chunks = FeedParser._hash_chunks(
+                response.content.iter_chunked(FETCH_CHUNK_SIZE), digest
+            )
+            async for product in FeedParser.parse_yml_stream(
+                chunks, result["shop"], result["categories"], result
+            ):
+                result["products"].append(product)
+            result["content_hash"] = digest.hexdigest()
+        
+        return result
 
 
 class FeedManager:
@@ -178,55 +716,121 @@ class FeedManager:
     
     def __init__(self, redis_client):
         self.redis = redis_client
+        # Один парсер (и одна HTTP-сессия) на всё время жизни менеджера
         self.parser = FeedParser()
     
-    async def load_feed(self, project_id: str, feed_url: str) -> Dict[str, Any]:
-        """Загрузка фида для проекта"""
+    async def aclose(self) -> None:
+        """Закрытие HTTP-сессии парсера"""
+        await self.parser.aclose()
+    
+    async def _save_feed_info(self, project_id: str, mapping: Dict[str, str]) -> None:
+        """
+        Запись метаданных фида за один round-trip
+
+        При успешной загрузке в том же pipeline удаляется поле error,
+        оставшееся от прошлой неудачной загрузки.
+        """
+        key = f"project:{project_id}:feed"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        if mapping.get("status") == "success":
+            pipe.hdel(key, "error")
+        await pipe.execute()
+    
+    async def load_feed(
+        self,
+        project_id: str,
+        feed_url: str,
+        conditional: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Загрузка фида для проекта
+
+        conditional=True - условный запрос по ETag/Last-Modified прошлой
+        загрузки с проверкой хеша содержимого; если фид не изменился,
+        возвращается {"success": True, "unchanged": True} без товаров.
+        """
         try:
-            print(f"[FeedManager] Loading feed from {feed_url} for project {project_id}")
+            logger.info("[FeedManager] Loading feed from %s for project %s", feed_url, project_id)
+            
+            etag = last_modified = content_hash = None
+            if conditional:
+                etag, last_modified, content_hash, prev_url = [
+                    v.decode() if isinstance(v, bytes) else v
+                    for v in await self.redis.hmget(
+                        f"project:{project_id}:feed",
+                        "etag", "last_modified", "content_hash", "url"
+                    )
+                ]
+                if prev_url != feed_url:
+                    # Валидаторы относятся к другому URL
+                    etag = last_modified = content_hash = None
             
             # Загружаем и парсим
-            data = await self.parser.load_and_parse(feed_url)
+            data = await self.parser.load_and_parse(
+                feed_url,
+                etag=etag,
+                last_modified=last_modified,
+                content_hash=content_hash or None
+            )
+            
+            if data.get("unchanged"):
+                logger.info("[FeedManager] Feed not modified for project %s", project_id)
+                info = {
+                    "last_update": datetime.utcnow().isoformat(),
+                    "status": "success"
+                }
+                # При совпавшем хеше сервер мог отдать новые валидаторы
+                for key in ("etag", "last_modified"):
+                    if key in data:
+                        info[key] = data[key] or ""
+                await self._save_feed_info(project_id, info)
+                return {"success": True, "unchanged": True}
             
-            print(f"[FeedManager] Parsed {len(data['products'])} products, {len(data['categories'])} categories")
+            logger.info(
+                "[FeedManager] Parsed %d products, %d categories",
+                len(data["products"]), len(data["categories"])
+            )
+            errors_count = data.get("errors_count", 0)
+            if errors_count:
+                logger.warning(
+                    "[FeedManager] Skipped %d malformed offers for project %s",
+                    errors_count, project_id
+                )
             
-            # Сохраняем метаданные фида
-            feed_info = {
+            # Сохраняем метаданные фида; все значения скалярные, поэтому
+            # сразу пишем строки без поштучного кодирования
+            await self._save_feed_info(project_id, {
                 "url": feed_url,
                 "last_update": datetime.utcnow().isoformat(),
-                "products_count": len(data["products"]),
-                "categories_count": len(data["categories"]),
-                "shop_name": data["shop"].get("name", ""),
+                "products_count": str(len(data["products"])),
+                "categories_count": str(len(data["categories"])),
+                "shop_name": str(data["shop"].get("name", "")),
+                "etag": data.get("etag") or "",
+                "last_modified": data.get("last_modified") or "",
+                "content_hash": data.get("content_hash") or "",
+                "errors_count": str(errors_count),
                 "status": "success"
-            }
-            
-            import json
-            await self.redis.hset(
-                f"project:{project_id}:feed",
-                mapping={k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) for k, v in feed_info.items()}
-            )
+            })
             
             return {
                 "success": True,
                 "products_count": len(data["products"]),
                 "categories_count": len(data["categories"]),
+                "errors_count": errors_count,
                 "shop": data["shop"],
                 "products": data["products"]
             }
             
         except Exception as e:
             # Сохраняем ошибку
-            print(f"[FeedManager] Error loading feed: {e}")
-            import json
-            await self.redis.hset(
-                f"project:{project_id}:feed",
-                mapping={
-                    "url": feed_url,
-                    "last_update": datetime.utcnow().isoformat(),
-                    "status": "error",
-                    "error": str(e)
-                }
-            )
+            logger.error("[FeedManager] Error loading feed %s: %s", feed_url, e)
+            await self._save_feed_info(project_id, {
+                "url": feed_url,
+                "last_update": datetime.utcnow().isoformat(),
+                "status": "error",
+                "error": str(e)
+            })
             return {
                 "success": False,
                 "error": str(e)
@@ -235,14 +839,44 @@ class FeedManager:
     async def get_feed_status(self, project_id: str) -> Optional[Dict]:
         """Получение статуса фида проекта"""
         data = await self.redis.hgetall(f"project:{project_id}:feed")
+        return self._decode_feed_status(data)
+    
+    async def get_feed_statuses(
+        self,
+        project_ids: List[str],
+        fields: Tuple[str, ...] = ("status", "last_update")
+    ) -> Dict[str, Optional[Dict]]:
+        """
+        Статусы фидов нескольких проектов за один round-trip (pipeline)
+        
+        Читаются и декодируются только fields (HMGET), а не весь хеш;
+        None - у проекта нет ни одного из полей.
+        """
+        if not project_ids:
+            return {}
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for project_id in project_ids:
+            pipe.hmget(f"project:{project_id}:feed", *fields)
+        rows = await pipe.execute()
+        
+        statuses = {}
+        for project_id, row in zip(project_ids, rows):
+            status = {
+                field: value.decode() if isinstance(value, bytes) else value
+                for field, value in zip(fields, row)
+                if value is not None
+            }
+            statuses[project_id] = status or None
+        return statuses
+    
+    @staticmethod
+    def _decode_feed_status(data) -> Optional[Dict]:
+        """Хеш статуса фида из Redis -> dict строк; None, если хеша нет"""
         if not data:
             return None
         
-        # Декодируем bytes в строки
-        result = {}
-        for k, v in data.items():
-            key = k.decode() if isinstance(k, bytes) else k
-            val = v.decode() if isinstance(v, bytes) else v
-            result[key] = val
-        
-        return result
+        return {
+            k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+            for k, v in data.items()
+        }
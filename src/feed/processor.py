@@ -2,18 +2,214 @@
 Обработчик фидов товаров
 """
 import aiohttp
-import xml.etree.ElementTree as ET
+import csv
+import gc
+from lxml import etree as ET
 import json
 import io
-from typing import List, Dict, Any, Tuple, Optional
+import logging
+import re
+import uuid
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator, AsyncIterator, Callable
+from contextlib import contextmanager
 from datetime import datetime
 from dataclasses import dataclass
 
 from ..core.models import Feed, FeedLog, Product, FeedType, FeedFormat, FeedStatus
 from ..core.interfaces import IFeedProcessor, IIndexer
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+try:
+    import orjson
+except ImportError:  # опциональная зависимость - без неё stdlib json
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # опциональная зависимость - без неё JSON разбирается целиком
+    ijson = None
+
+try:
+    import numpy as np
+except ImportError:  # опциональная зависимость - без неё цены приводятся через map(float)
+    np = None
+
+
+# Элементы товаров в XML фидах; {*} - в любом пространстве имён или без него
+_PRODUCT_TAGS = ("{*}offer", "{*}item", "{*}product", "{*}entry")
+_DELTA_TAGS = ("{*}item", "{*}offer", "{*}product")
+
+# HTML теги в описаниях товаров
+_RE_HTML = re.compile(r"<[^>]+>")
+# Всё, кроме цифр и точки, в строке цены (валюта, пробелы, единицы)
+_RE_PRICE_JUNK = re.compile(r"[^\d.]")
+# Цена, которую float() и поштучный разбор читают одинаково
+_RE_PLAIN_PRICE = re.compile(r"\d+(?:\.\d+)?")
+# Колонка таких цен, склеенная через перевод строки
+_RE_PLAIN_PRICE_COLUMN = re.compile(r"(?:\d+(?:\.\d+)?\n)*\d+(?:\.\d+)?")
+
+# Строковые значения наличия/флагов, означающие "да"
+_TRUTHY = frozenset(("true", "1", "yes", "в наличии", "available"))
+
+# Сколько байт начала фида смотреть при определении формата
+_SNIFF_SIZE = 4096
+
+# Ключи верхнего уровня JSON фида, под которыми ищется массив товаров
+_JSON_PRODUCT_KEYS = ("products", "items", "offers", "data")
+
+
+def _json_loads(content: bytes) -> Any:
+    """JSON из bytes: orjson, если установлен, иначе stdlib json"""
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson принимает только UTF-8 - UTF-16/32 и BOM разбирает stdlib
+            pass
+    return json.loads(content)
+
+
+def _json_products_coro(target):
+    """
+    Корутина для ijson.parse_coro: элементы массива товаров -> target
+
+    Массив товаров - корневой массив или первый в документе массив под
+    одним из _JSON_PRODUCT_KEYS верхнего уровня. Каждый элемент
+    собирается отдельно, весь массив в памяти не строится.
+    """
+    prefix = None
+    while True:
+        current, event, value = (yield)
+        if prefix is None:
+            if event == "start_array" and (current == "" or current in _JSON_PRODUCT_KEYS):
+                prefix = f"{current}.item" if current else "item"
+            continue
+        
+        if current != prefix:
+            continue
+        
+        if event in ("start_map", "start_array"):
+            builder = ijson.ObjectBuilder()
+            depth = 1
+            while depth:
+                builder.event(event, value)
+                current, event, value = (yield)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+            target.send(builder.value)
+        elif event != "end_array":
+            target.send(value)
+
+
+def _parse_decimal(value: Any) -> Optional[float]:
+    """Число с запятой вместо точки и пробелами между разрядами; None - не число"""
+    if isinstance(value, str):
+        value = value.replace(",", ".").replace(" ", "")
+    try:
+        return float(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _bulk_parse_prices(
+    values: List[Any],
+    parse_one: Callable[[Any], Optional[float]]
+) -> List[Optional[float]]:
+    """
+    Разбор колонки цен
+
+    Через float() (numpy - колонкой целиком, цикл в C) идут только значения,
+    которые поштучный разбор parse_one прочитал бы так же: числа и строки
+    вида "1990" / "1990.50". Всё остальное ("1 990,50 руб.", "1e3", None)
+    разбирается parse_one - цена товара не зависит от соседей по колонке.
+    """
+    if not values:
+        return []
+    
+    try:
+        column = "\n".join(values)
+    except TypeError:
+        column = None
+    
+    if column is not None:
+        # Только строки: одна проверка regex на всю колонку
+        plain = _RE_PLAIN_PRICE_COLUMN.fullmatch(column) is not None
+    else:
+        plain = all(type(value) in (int, float) for value in values)
+    
+    if plain:
+        try:
+            if np is not None:
+                arr = np.asarray(values, dtype=np.float64)
+                if arr.shape == (len(values),):
+                    return arr.tolist()
+            else:
+                return list(map(float, values))
+        except (ValueError, TypeError, OverflowError):
+            pass
+    
+    is_plain = _RE_PLAIN_PRICE.fullmatch
+    return [
+        float(value)
+        if type(value) in (int, float) or (type(value) is str and is_plain(value))
+        else parse_one(value)
+        for value in values
+    ]
+
+
+def _compile_field_mapping(
+    field_mapping: Dict[str, List[str]]
+) -> Tuple[Tuple[str, Tuple[Tuple[bool, str], ...]], ...]:
+    """
+    Маппинг полей -> план извлечения для _extract_product_from_xml
+
+    План - кортеж (поле, ((атрибут?, имя), ...)) в порядке приоритета
+    тегов; id извлекается отдельно. Строится один раз на формат, чтобы
+    не разбирать маппинг (startswith("@"), срез) на каждом товаре.
+    """
+    return tuple(
+        (field, tuple(
+            (True, tag[1:]) if tag.startswith("@") else (False, tag)
+            for tag in tags
+        ))
+        for field, tags in field_mapping.items()
+        if field != "id"
+    )
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Сборщик циклов выключен на время синхронного цикла
+
+    Товары (dict, Product) циклов не образуют, а на больших фидах сборщик
+    запускается каждые несколько сотен созданных объектов и раз за разом
+    обходит растущие списки товаров. Только для кода без await: пока он
+    выполняется, остальные задачи event loop стоят и ничего не создают.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _release(elem) -> None:
+    """Освобождает разобранный элемент и уже обработанных соседей,
+    чтобы дерево не росло по мере чтения фида"""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+@dataclass(slots=True)
 class StockUpdate:
     """Обновление остатков/цен"""
     id: str
@@ -21,6 +217,18 @@ class StockUpdate:
     old_price: Optional[float] = None
     in_stock: Optional[bool] = None
     quantity: Optional[int] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Обновление для IIndexer.update_stock_prices: все поля, как в
+        прежнем __dict__ (у slots-класса его нет). None в old_price
+        снимает скидку, закончившуюся в фиде"""
+        return {
+            "id": self.id,
+            "price": self.price,
+            "old_price": self.old_price,
+            "in_stock": self.in_stock,
+            "quantity": self.quantity,
+        }
 
 
 class FeedProcessor(IFeedProcessor):
@@ -71,6 +279,39 @@ class FeedProcessor(IFeedProcessor):
         self.config = config or {}
         self.max_feed_size = self.config.get("max_feed_size", 500 * 1024 * 1024)  # 500MB
         self.download_timeout = self.config.get("download_timeout", 300)
+        self._field_plans = {
+            format: _compile_field_mapping(mapping)
+            for format, mapping in self.FIELD_MAPPINGS.items()
+        }
+        # Одна HTTP-сессия на всё время жизни обработчика: соединения,
+        # DNS и TLS переиспользуются между загрузками
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def __aenter__(self) -> "FeedProcessor":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    def _client(self) -> aiohttp.ClientSession:
+        """Общая сессия, создаётся при первой загрузке"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    ttl_dns_cache=300,
+                    # Короткий keep-alive: простаивающие между загрузками
+                    # соединения не доживают до протухания
+                    keepalive_timeout=30
+                )
+            )
+        return self._session
+    
+    async def aclose(self) -> None:
+        """Закрытие HTTP-сессии"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
     async def process_full_feed(self, feed: Feed) -> FeedLog:
         """
@@ -91,11 +332,12 @@ class FeedProcessor(IFeedProcessor):
         )
         
         try:
-            # 1. Загрузка
-            content = await self.download_feed(feed.url)
-            
-            # 2. Парсинг
-            raw_products = self.parse_feed(content, feed.format.value)
+            # 1-2. Загрузка и парсинг (XML разбирается по мере скачивания)
+            raw_products = [
+                p async for p in self._parse_feed_stream(
+                    self.stream_feed(feed.url), feed.format.value
+                )
+            ]
             log.items_processed = len(raw_products)
             
             # 3. Валидация
@@ -143,11 +385,13 @@ class FeedProcessor(IFeedProcessor):
             updates = self._parse_delta_feed(content, feed.format.value)
             log.items_processed = len(updates)
             
+            # Замена на месте: каждый StockUpdate освобождается сразу после
+            # преобразования, объекты и dict не держатся в памяти вместе
+            for i, update in enumerate(updates):
+                updates[i] = update.to_dict()
+            
             # 3. Применение обновлений
-            updated = await self.indexer.update_stock_prices(
-                feed.project_id,
-                [u.__dict__ for u in updates]
-            )
+            updated = await self.indexer.update_stock_prices(feed.project_id, updates)
             log.items_updated = updated
             
             # Успех
@@ -163,38 +407,65 @@ class FeedProcessor(IFeedProcessor):
     
     async def download_feed(self, url: str) -> bytes:
         """
-        Загрузка фида с поддержкой больших файлов
+        Загрузка фида целиком (для небольших delta/JSON/CSV фидов)
+        """
+        return b"".join([chunk async for chunk in self.stream_feed(url)])
+    
+    async def stream_feed(self, url: str) -> AsyncIterator[bytes]:
+        """
+        Загрузка фида чанками, без буферизации всего тела
         """
         timeout = aiohttp.ClientTimeout(total=self.download_timeout)
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise FeedDownloadError(
-                        f"Failed to download feed: HTTP {response.status}"
-                    )
+        async with self._client().get(url, timeout=timeout) as response:
+            if response.status != 200:
+                raise FeedDownloadError(
+                    f"Failed to download feed: HTTP {response.status}"
+                )
+            
+            # Проверяем размер
+            content_length = response.headers.get("Content-Length")
+            if content_length and int(content_length) > self.max_feed_size:
+                raise FeedTooLargeError(
+                    f"Feed too large: {content_length} bytes"
+                )
+            
+            # Стриминг загрузки
+            total_size = 0
+            
+            async for chunk in response.content.iter_chunked(1024 * 1024):
+                total_size += len(chunk)
                 
-                # Проверяем размер
-                content_length = response.headers.get("Content-Length")
-                if content_length and int(content_length) > self.max_feed_size:
+                if total_size > self.max_feed_size:
                     raise FeedTooLargeError(
-                        f"Feed too large: {content_length} bytes"
+                        f"Feed too large: {total_size} bytes"
                     )
                 
-                # Стриминг загрузки
-                chunks = []
-                total_size = 0
-                
-                async for chunk in response.content.iter_chunked(1024 * 1024):
-                    chunks.append(chunk)
-                    total_size += len(chunk)
-                    
-                    if total_size > self.max_feed_size:
-                        raise FeedTooLargeError(
-                            f"Feed too large: {total_size} bytes"
-                        )
-                
-                return b"".join(chunks)
+                yield chunk
+    
+    def _sniff_feed(self, content_start: bytes, format: str) -> Tuple[str, bool]:
+        """
+        Формат фида по первым _SNIFF_SIZE байтам: (xml, json или csv; YML ли)
+        
+        Формат - по первому непробельному байту, если не указан явно.
+        YML опознаётся по корню yml_catalog (или offer) в начале документа,
+        весь фид для этого не просматривается.
+        """
+        head = content_start[:_SNIFF_SIZE].lstrip()
+        first = head[:1]
+        
+        if format == "xml" or first == b"<":
+            detected = "xml"
+        elif format == "json" or first in (b"{", b"["):
+            detected = "json"
+        elif format == "csv":
+            detected = "csv"
+        else:
+            # Пробуем XML по умолчанию
+            detected = "xml"
+        
+        is_yml = detected == "xml" and (b"<yml_catalog" in head or b"<offer" in head)
+        return detected, is_yml
     
     def parse_feed(
         self,
@@ -204,50 +475,138 @@ class FeedProcessor(IFeedProcessor):
         """
         Парсинг фида в зависимости от формата
         """
-        # Определяем формат по содержимому, если не указан
-        content_start = content[:100].strip()
+        detected, is_yml = self._sniff_feed(content, format)
         
-        if format == "xml" or content_start.startswith(b"<?xml") or content_start.startswith(b"<"):
-            return self._parse_xml_feed(content)
-        elif format == "json" or content_start.startswith(b"{") or content_start.startswith(b"["):
-            return self._parse_json_feed(content)
-        elif format == "csv":
-            return self._parse_csv_feed(content)
-        else:
-            # Пробуем XML по умолчанию
-            return self._parse_xml_feed(content)
+        with _gc_paused():
+            if detected == "json":
+                return self._parse_json_feed(content)
+            elif detected == "csv":
+                return self._parse_csv_feed(content)
+            return self._parse_xml_feed(content, is_yml)
     
-    def _parse_xml_feed(self, content: bytes) -> List[Dict[str, Any]]:
+    async def _parse_feed_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        format: str
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Парсинг XML фида (YML или Google Merchant)
+        Парсинг фида по мере скачивания
+
+        Формат определяется по началу фида. XML и JSON (если установлен
+        ijson) разбираются потоково, CSV дочитывается и разбирается целиком.
         """
-        products = []
+        chunks = chunks.__aiter__()
+        head = b""
+        async for chunk in chunks:
+            head += chunk
+            if len(head) >= _SNIFF_SIZE:
+                break
         
-        # Определяем тип фида
-        is_yml = b"<yml_catalog" in content or b"<offer" in content
-        field_mapping = self.FIELD_MAPPINGS["yml" if is_yml else "google"]
+        detected, is_yml = self._sniff_feed(head, format)
         
-        # Потоковый парсинг для экономии памяти
-        for event, elem in ET.iterparse(io.BytesIO(content), events=["end"]):
-            tag = elem.tag.split("}")[-1] if "}" in elem.tag else elem.tag
-            
-            if tag in ("offer", "item", "product", "entry"):
-                product = self._extract_product_from_xml(elem, field_mapping)
-                if product:
-                    products.append(product)
-                
-                # Очищаем память
-                elem.clear()
+        if detected == "json" and ijson is not None:
+            async for product in self._parse_json_stream(head, chunks):
+                yield product
+            return
         
-        return products
+        if detected != "xml":
+            content = head + b"".join([chunk async for chunk in chunks])
+            for product in self.parse_feed(content, format):
+                yield product
+            return
+        
+        parser = ET.XMLPullParser(
+            events=("end",),
+            tag=_PRODUCT_TAGS,
+            huge_tree=True,
+            recover=True
+        )
+        
+        parser.feed(head)
+        for product in self._handle_xml_events(parser.read_events(), is_yml):
+            yield product
+        
+        async for chunk in chunks:
+            parser.feed(chunk)
+            for product in self._handle_xml_events(parser.read_events(), is_yml):
+                yield product
+        
+        parser.close()
+        for product in self._handle_xml_events(parser.read_events(), is_yml):
+            yield product
+    
+    async def _parse_json_stream(
+        self,
+        head: bytes,
+        chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый парсинг JSON фида через ijson
+
+        В отличие от _parse_json_feed, при нескольких массивах под
+        известными ключами берётся первый по порядку в документе.
+        """
+        products = ijson.sendable_list()
+        selector = _json_products_coro(products)
+        next(selector)
+        parser = ijson.parse_coro(selector, use_float=True)
+        
+        parser.send(head)
+        for product in products:
+            yield product
+        del products[:]
+        
+        async for chunk in chunks:
+            parser.send(chunk)
+            for product in products:
+                yield product
+            del products[:]
+        
+        parser.close()
+        for product in products:
+            yield product
+    
+    def _handle_xml_events(
+        self,
+        events: Iterable,
+        is_yml: bool
+    ) -> Iterator[Dict[str, Any]]:
+        """Разбор элементов товаров из событий XMLPullParser"""
+        for _, elem in events:
+            # offer - элемент YML, даже если по началу фида тип не опознан
+            yml = is_yml or elem.tag == "offer"
+            plan = self._field_plans["yml" if yml else "google"]
+            product = self._extract_product_from_xml(elem, plan)
+            _release(elem)
+            if product:
+                yield product
+    
+    def _parse_xml_feed(self, content: bytes, is_yml: bool) -> List[Dict[str, Any]]:
+        """
+        Парсинг XML фида (YML или Google Merchant)
+
+        Фильтр tag= отрабатывает в libxml2 - в Python попадают только
+        элементы товаров; разобранные элементы сразу освобождаются.
+        is_yml - из _sniff_feed; offer разбирается как YML в любом случае.
+        """
+        events = ET.iterparse(
+            io.BytesIO(content),
+            events=("end",),
+            tag=_PRODUCT_TAGS,
+            huge_tree=True,
+            recover=True
+        )
+        return list(self._handle_xml_events(events, is_yml))
     
     def _extract_product_from_xml(
         self, 
-        elem: ET.Element, 
-        field_mapping: Dict
+        elem: ET._Element, 
+        plan: Tuple
     ) -> Optional[Dict[str, Any]]:
         """
         Извлечение данных товара из XML элемента
+        
+        plan - результат _compile_field_mapping для формата фида
         """
         product = {}
         
@@ -261,25 +620,40 @@ class FeedProcessor(IFeedProcessor):
         if not product["id"]:
             return None
         
-        # Остальные поля
-        for field, possible_tags in field_mapping.items():
-            if field == "id":
+        # Дочерние элементы за один проход: по точному тегу (как find) и
+        # по имени без namespace; заодно picture и param.
+        # В by_local_name - только теги с namespace: тег без него и так
+        # находится в by_tag, который проверяется первым. Имя - через
+        # rpartition: QName(child).localname создаёт объект на каждый тег
+        # и в несколько раз медленнее
+        by_tag = {}
+        by_local_name = {}
+        pictures = []
+        params = []
+        for child in elem:
+            child_tag = child.tag
+            if not isinstance(child_tag, str):
+                # Комментарии и processing instructions
                 continue
-            
-            for tag in possible_tags:
-                if tag.startswith("@"):
+            by_tag.setdefault(child_tag, child)
+            if "}" in child_tag:
+                by_local_name.setdefault(child_tag.rpartition("}")[2], child)
+            if child_tag == "picture":
+                pictures.append(child)
+            elif child_tag == "param":
+                params.append(child)
+        
+        # Остальные поля
+        for field, sources in plan:
+            for is_attr, tag in sources:
+                if is_attr:
                     # Атрибут
-                    value = elem.get(tag[1:])
+                    value = elem.get(tag)
                 else:
-                    # Вложенный элемент
-                    child = elem.find(tag)
+                    # Вложенный элемент, в т.ч. с namespace
+                    child = by_tag.get(tag)
                     if child is None:
-                        # Пробуем с namespace
-                        for ns_child in elem:
-                            child_tag = ns_child.tag.split("}")[-1] if "}" in ns_child.tag else ns_child.tag
-                            if child_tag == tag:
-                                child = ns_child
-                                break
+                        child = by_local_name.get(tag)
                     
                     value = child.text if child is not None else None
                 
@@ -288,12 +662,10 @@ class FeedProcessor(IFeedProcessor):
                     break
         
         # Дополнительные изображения
-        pictures = elem.findall("picture")
         if len(pictures) > 1:
             product["images"] = [p.text for p in pictures if p.text]
         
         # Атрибуты (param в YML)
-        params = elem.findall("param")
         if params:
             product["attributes"] = {}
             for param in params:
@@ -307,7 +679,7 @@ class FeedProcessor(IFeedProcessor):
         """
         Парсинг JSON фида
         """
-        data = json.loads(content)
+        data = _json_loads(content)
         
         # Ищем массив товаров
         if isinstance(data, list):
@@ -323,17 +695,40 @@ class FeedProcessor(IFeedProcessor):
     def _parse_csv_feed(self, content: bytes) -> List[Dict[str, Any]]:
         """
         Парсинг CSV фида
-        """
-        import csv
         
+        Строки собираются как в csv.DictReader (первая строка - заголовок,
+        пустые строки пропускаются), но без его Python-итерации на строку:
+        строки полной ширины - dict(zip(...)) прямо в генераторе списка.
+        """
         # Определяем кодировку
         try:
             text = content.decode("utf-8")
         except UnicodeDecodeError:
             text = content.decode("cp1251")
         
-        reader = csv.DictReader(io.StringIO(text))
-        return list(reader)
+        rows = csv.reader(io.StringIO(text))
+        header = next(rows, None)
+        if header is None:
+            return []
+        
+        width = len(header)
+        return [
+            dict(zip(header, row)) if len(row) == width else self._csv_ragged_row(header, row)
+            for row in rows
+            if row
+        ]
+    
+    @staticmethod
+    def _csv_ragged_row(header: List[str], row: List[str]) -> Dict[str, Any]:
+        """Строка CSV не по ширине заголовка: лишние значения - под ключом
+        None, недостающие поля - None (как в csv.DictReader)"""
+        item: Dict[Any, Any] = dict(zip(header, row))
+        if len(row) > len(header):
+            item[None] = row[len(header):]
+        else:
+            for key in header[len(row):]:
+                item[key] = None
+        return item
     
     def _parse_delta_feed(
         self, 
@@ -346,50 +741,62 @@ class FeedProcessor(IFeedProcessor):
         updates = []
         
         if format in ("xml", "yml"):
-            for event, elem in ET.iterparse(io.BytesIO(content), events=["end"]):
-                tag = elem.tag.split("}")[-1] if "}" in elem.tag else elem.tag
+            # Цены копятся колонками и разбираются после чтения фида
+            priced, price_texts = [], []
+            old_priced, old_price_texts = [], []
+            
+            for _, elem in ET.iterparse(
+                io.BytesIO(content),
+                events=("end",),
+                tag=_DELTA_TAGS,
+                huge_tree=True,
+                recover=True
+            ):
+                update = StockUpdate(id=elem.get("id") or elem.findtext("id"))
                 
-                if tag in ("item", "offer", "product"):
-                    update = StockUpdate(id=elem.get("id") or elem.findtext("id"))
-                    
-                    if not update.id:
-                        elem.clear()
-                        continue
-                    
-                    # Цена
-                    price_elem = elem.find("price")
-                    if price_elem is not None and price_elem.text:
-                        try:
-                            update.price = float(price_elem.text.replace(",", ".").replace(" ", ""))
-                        except ValueError:
-                            pass
-                    
-                    # Старая цена
-                    old_price_elem = elem.find("oldprice") or elem.find("old_price")
-                    if old_price_elem is not None and old_price_elem.text:
-                        try:
-                            update.old_price = float(old_price_elem.text.replace(",", ".").replace(" ", ""))
-                        except ValueError:
-                            pass
-                    
-                    # Наличие
-                    available = elem.get("available") or elem.findtext("available") or elem.findtext("in_stock")
-                    if available:
-                        update.in_stock = available.lower() in ("true", "1", "yes", "в наличии")
-                    
-                    # Количество
-                    quantity_elem = elem.find("quantity") or elem.find("stock_quantity")
-                    if quantity_elem is not None and quantity_elem.text:
-                        try:
-                            update.quantity = int(quantity_elem.text)
-                        except ValueError:
-                            pass
-                    
-                    updates.append(update)
-                    elem.clear()
+                if not update.id:
+                    _release(elem)
+                    continue
+                
+                # Цена
+                price_elem = elem.find("price")
+                if price_elem is not None and price_elem.text:
+                    priced.append(update)
+                    price_texts.append(price_elem.text)
+                
+                # Старая цена
+                old_price_elem = elem.find("oldprice")
+                if old_price_elem is None:
+                    old_price_elem = elem.find("old_price")
+                if old_price_elem is not None and old_price_elem.text:
+                    old_priced.append(update)
+                    old_price_texts.append(old_price_elem.text)
+                
+                # Наличие
+                available = elem.get("available") or elem.findtext("available") or elem.findtext("in_stock")
+                if available:
+                    update.in_stock = available.lower() in _TRUTHY
+                
+                # Количество
+                quantity_elem = elem.find("quantity")
+                if quantity_elem is None:
+                    quantity_elem = elem.find("stock_quantity")
+                if quantity_elem is not None and quantity_elem.text:
+                    try:
+                        update.quantity = int(quantity_elem.text)
+                    except ValueError:
+                        pass
+                
+                updates.append(update)
+                _release(elem)
+            
+            for update, price in zip(priced, _bulk_parse_prices(price_texts, _parse_decimal)):
+                update.price = price
+            for update, price in zip(old_priced, _bulk_parse_prices(old_price_texts, _parse_decimal)):
+                update.old_price = price
         
         elif format == "json":
-            data = json.loads(content)
+            data = _json_loads(content)
             items = data if isinstance(data, list) else data.get("items", data.get("products", []))
             
             for item in items:
@@ -416,6 +823,21 @@ class FeedProcessor(IFeedProcessor):
         errors = []
         
         for product in products:
+            # Быстрый путь: обязательные поля на месте, цена - число.
+            # Исключение - только у товаров с ошибками
+            try:
+                if product["id"] and product["name"] and product["url"]:
+                    price = product.get("price")
+                    if price:
+                        if isinstance(price, str):
+                            price = price.replace(",", ".").replace(" ", "")
+                        float(price)
+                    valid.append(product)
+                    continue
+            except (KeyError, ValueError, TypeError, OverflowError):
+                pass
+            
+            # Товар не прошёл - собираем все ошибки
             validation_errors = []
             
             # Обязательные поля
@@ -427,22 +849,13 @@ class FeedProcessor(IFeedProcessor):
                 validation_errors.append("Missing URL")
             
             # Валидация типов
-            if product.get("price"):
-                try:
-                    price = product["price"]
-                    if isinstance(price, str):
-                        price = price.replace(",", ".").replace(" ", "")
-                    float(price)
-                except (ValueError, TypeError):
-                    validation_errors.append("Invalid price format")
+            if product.get("price") and _parse_decimal(product["price"]) is None:
+                validation_errors.append("Invalid price format")
             
-            if validation_errors:
-                errors.append({
-                    "product_id": product.get("id"),
-                    "errors": validation_errors
-                })
-            else:
-                valid.append(product)
+            errors.append({
+                "product_id": product.get("id"),
+                "errors": validation_errors
+            })
         
         return valid, errors
     
@@ -452,38 +865,55 @@ class FeedProcessor(IFeedProcessor):
         """
         products = []
         
-        for raw in raw_products:
-            try:
-                # Парсим цены
-                price = self._parse_price(raw.get("price", 0))
-                old_price = self._parse_price(raw.get("old_price")) if raw.get("old_price") else None
+        # Цены разбираются колонками до цикла по товарам
+        prices = _bulk_parse_prices(
+            [raw.get("price", 0) for raw in raw_products],
+            self._parse_price_or_none
+        )
+        with_old_price = [raw for raw in raw_products if raw.get("old_price")]
+        old_prices = dict(zip(
+            map(id, with_old_price),
+            _bulk_parse_prices(
+                [raw["old_price"] for raw in with_old_price],
+                self._parse_price_or_none
+            )
+        ))
+        
+        with _gc_paused():
+            for raw, price in zip(raw_products, prices):
+                try:
+                    old_price = old_prices.get(id(raw))
+                    if price is None or (old_price is None and raw.get("old_price")):
+                        raise ValueError(
+                            f"invalid price {raw.get('price')!r} / {raw.get('old_price')!r}"
+                        )
                 
-                # Парсим наличие
-                in_stock = self._parse_bool(raw.get("in_stock", True))
+                    # Парсим наличие
+                    in_stock = self._parse_bool(raw.get("in_stock", True))
                 
-                product = Product(
-                    id=str(raw["id"]),
-                    name=self._clean_text(raw["name"]),
-                    description=self._clean_text(raw.get("description", "")),
-                    url=raw["url"],
-                    image=raw.get("image"),
-                    images=raw.get("images", []),
-                    price=price,
-                    old_price=old_price,
-                    in_stock=in_stock,
-                    quantity=int(raw["quantity"]) if raw.get("quantity") else None,
-                    category=raw.get("category"),
-                    brand=raw.get("brand"),
-                    vendor_code=raw.get("vendor_code"),
-                    params=raw.get("params", {}),
-                    attributes=raw.get("attributes", {}),
-                )
+                    product = Product(
+                        id=str(raw["id"]),
+                        name=self._clean_text(raw["name"]),
+                        description=self._clean_text(raw.get("description", "")),
+                        url=raw["url"],
+                        image=raw.get("image"),
+                        images=raw.get("images", []),
+                        price=price,
+                        old_price=old_price,
+                        in_stock=in_stock,
+                        quantity=int(raw["quantity"]) if raw.get("quantity") else None,
+                        category=raw.get("category"),
+                        brand=raw.get("brand"),
+                        vendor_code=raw.get("vendor_code"),
+                        params=raw.get("params", {}),
+                        attributes=raw.get("attributes", {}),
+                    )
                 
-                products.append(product)
+                    products.append(product)
                 
-            except Exception as e:
-                # Логируем ошибку, но продолжаем
-                print(f"Error transforming product {raw.get('id')}: {e}")
+                except Exception as e:
+                    # Логируем ошибку, но продолжаем
+                    logger.warning("Error transforming product %s: %s", raw.get("id"), e)
         
         return products
     
@@ -495,17 +925,23 @@ class FeedProcessor(IFeedProcessor):
             return float(value)
         if isinstance(value, str):
             # Убираем валюту и пробелы
-            cleaned = value.replace(",", ".").replace(" ", "")
-            cleaned = "".join(c for c in cleaned if c.isdigit() or c == ".")
+            cleaned = _RE_PRICE_JUNK.sub("", value.replace(",", "."))
             return float(cleaned) if cleaned else 0.0
         return 0.0
     
+    def _parse_price_or_none(self, value) -> Optional[float]:
+        """_parse_price для колонки цен: None вместо исключения"""
+        try:
+            return self._parse_price(value)
+        except (ValueError, OverflowError):
+            return None
+    
     def _parse_bool(self, value) -> bool:
         """Парсинг булевого значения"""
         if isinstance(value, bool):
             return value
         if isinstance(value, str):
-            return value.lower() in ("true", "1", "yes", "в наличии", "available")
+            return value.lower() in _TRUTHY
         return bool(value)
     
     def _clean_text(self, text: str) -> str:
@@ -513,15 +949,13 @@ class FeedProcessor(IFeedProcessor):
         if not text:
             return ""
         # Удаляем HTML теги
-        import re
-        text = re.sub(r"<[^>]+>", "", text)
-        # Удаляем множественные пробелы
-        text = " ".join(text.split())
-        return text.strip()
+        if "<" in text:
+            text = _RE_HTML.sub("", text)
+        # Удаляем множественные пробелы (split без аргументов быстрее \s+)
+        return " ".join(text.split())
     
     def _generate_id(self) -> str:
         """Генерация уникального ID"""
-        import uuid
         return str(uuid.uuid4())
 
 
@@ -3,9 +3,12 @@
 Простая версия для работы с Redis
 """
 import asyncio
+import logging
 from datetime import datetime, timedelta
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 class SimpleFeedScheduler:
     """
@@ -15,6 +18,7 @@ class SimpleFeedScheduler:
     
     UPDATE_INTERVAL_HOURS = 4  # Интервал обновления в часах
     CHECK_INTERVAL_MINUTES = 15  # Интервал проверки
+    PARALLEL_UPDATES = 4  # Одновременных загрузок (фид целиком держится в памяти)
     
     def __init__(self, redis_client, feed_manager, data_store, indexer):
         self.redis = redis_client
@@ -23,6 +27,7 @@ class SimpleFeedScheduler:
         self.indexer = indexer
         self._task: Optional[asyncio.Task] = None
         self._running = False
+        self._semaphore = asyncio.Semaphore(self.PARALLEL_UPDATES)
     
     async def start(self):
         """Запуск планировщика"""
@@ -31,7 +36,7 @@ class SimpleFeedScheduler:
         
         self._running = True
         self._task = asyncio.create_task(self._scheduler_loop())
-        print(f"✓ Feed scheduler started (auto-update every {self.UPDATE_INTERVAL_HOURS}h)")
+        logger.info("Feed scheduler started (auto-update every %sh)", self.UPDATE_INTERVAL_HOURS)
     
     async def stop(self):
         """Остановка планировщика"""
@@ -42,7 +47,7 @@ class SimpleFeedScheduler:
                 await self._task
             except asyncio.CancelledError:
                 pass
-        print("✓ Feed scheduler stopped")
+        logger.info("Feed scheduler stopped")
     
     async def _scheduler_loop(self):
         """Основной цикл планировщика"""
@@ -53,15 +58,13 @@ class SimpleFeedScheduler:
             try:
                 await self._check_and_update_feeds()
             except Exception as e:
-                print(f"Scheduler error: {e}")
+                logger.error("Scheduler error: %s", e)
             
             # Спим между проверками
             await asyncio.sleep(self.CHECK_INTERVAL_MINUTES * 60)
     
     async def _check_and_update_feeds(self):
         """Проверка и обновление устаревших фидов"""
-        from ..core.models import Product
-
         # Проекты и их feed_url живут в PostgreSQL, а не в Redis - раньше здесь
         # читался несуществующий Redis-хеш "project:{id}" с полем feed_url, которое
         # туда никогда не писалось (Redis-хеш project:{id} используется только для
@@ -70,146 +73,179 @@ class SimpleFeedScheduler:
         try:
             projects = await self.data_store.get_all_projects()
         except Exception as e:
-            print(f"[Scheduler] Failed to load projects: {e}")
+            logger.error("[Scheduler] Failed to load projects: %s", e)
             return
 
         now = datetime.utcnow()
         update_threshold = now - timedelta(hours=self.UPDATE_INTERVAL_HOURS)
 
+        projects = [project for project in projects if project.get("feed_url")]
+        
+        # Статусы фидов всех проектов - одним pipeline, а не HGETALL на проект
+        try:
+            feed_statuses = await self.feed_manager.get_feed_statuses(
+                [project["id"] for project in projects]
+            )
+        except Exception as e:
+            logger.error("[Scheduler] Failed to load feed statuses: %s", e)
+            return
+        
+        # Проекты проверяются параллельно, сами загрузки ограничены семафором
+        results = await asyncio.gather(
+            *(
+                self._update_project(project, feed_statuses[project["id"]], update_threshold)
+                for project in projects
+            ),
+            return_exceptions=True
+        )
+        
         updated_count = 0
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("[Scheduler] Error checking project: %s", result)
+            elif result:
+                updated_count += 1
+        
+        if updated_count > 0:
+            logger.info("[Scheduler] Completed: %s feeds updated", updated_count)
+    
+    async def _update_project(
+        self,
+        project: dict,
+        feed_status: Optional[dict],
+        update_threshold: datetime
+    ) -> bool:
+        """Обновление фида проекта, если он устарел; True - фид переиндексирован"""
+        project_id = project["id"]
+        feed_url = project["feed_url"]
 
-        for project in projects:
-            try:
-                project_id = project["id"]
-                feed_url = project.get("feed_url")
-                if not feed_url:
-                    continue
-
-                # Проверяем время последнего обновления
-                feed_status = await self.feed_manager.get_feed_status(project_id)
+        # Проверяем время последнего обновления
+        should_update = True
+        
+        if feed_status:
+            last_update_str = feed_status.get("last_update")
+            if last_update_str:
+                try:
+                    last_update = datetime.fromisoformat(last_update_str.replace('Z', ''))
+                    if last_update > update_threshold:
+                        # Фид ещё свежий, пропускаем
+                        should_update = False
+                except:
+                    pass
+        
+        if not should_update:
+            return False
+        
+        async with self._semaphore:
+            return await self._update_feed(project_id, feed_url, feed_status)
+    
+    async def _update_feed(self, project_id: str, feed_url: str, feed_status: Optional[dict]) -> bool:
+        """Загрузка и индексация фида проекта с записью статуса в Redis"""
+        from ..core.models import ProductBatch
+        
+        # Обновляем фид
+        logger.info("[Scheduler] Auto-updating feed for %s", project_id)
+        
+        # Устанавливаем статус "downloading"
+        await self.redis.hset(
+            f"project:{project_id}:feed",
+            mapping={
+                "status": "downloading",
+                "progress": "0",
+                "message": "Автообновление фида...",
+                "update_started": datetime.utcnow().isoformat()
+            }
+        )
+        
+        try:
+            # Загружаем фид. Если прошлая загрузка дошла до конца,
+            # запрос условный - неизменившийся фид не скачивается и
+            # не переиндексируется
+            result = await self.feed_manager.load_feed(
+                project_id, feed_url,
+                conditional=bool(feed_status) and feed_status.get("status") == "success"
+            )
+            
+            if result["success"] and result.get("unchanged"):
+                # last_update тоже сдвигается: фид проверен и актуален,
+                # следующая проверка - через UPDATE_INTERVAL_HOURS
+                now = datetime.utcnow().isoformat()
+                await self.redis.hset(
+                    f"project:{project_id}:feed",
+                    mapping={
+                        "status": "success",
+                        "progress": "100",
+                        "message": "Фид не изменился",
+                        "last_update": now,
+                        "last_auto_update": now,
+                        "auto_update_status": "unchanged"
+                    }
+                )
+                logger.info("[Scheduler] Feed unchanged for %s", project_id)
+            elif result["success"]:
+                # Статус индексации
+                await self.redis.hset(
+                    f"project:{project_id}:feed",
+                    mapping={
+                        "status": "indexing",
+                        "progress": "50",
+                        "message": f"Индексация {result['products_count']} товаров..."
+                    }
+                )
                 
-                should_update = True
+                # Сохраняем товары
+                await self.data_store.save_products(project_id, result["products"])
                 
-                if feed_status:
-                    last_update_str = feed_status.get("last_update")
-                    if last_update_str:
-                        try:
-                            last_update = datetime.fromisoformat(last_update_str.replace('Z', ''))
-                            if last_update > update_threshold:
-                                # Фид ещё свежий, пропускаем
-                                should_update = False
-                        except:
-                            pass
+                # Конвертируем в колоночную пачку и индексируем
+                products_batch = ProductBatch.from_dicts(result["products"])
                 
-                if not should_update:
-                    continue
+                await self.indexer.index_products(project_id, products_batch)
                 
-                # Обновляем фид
-                print(f"[Scheduler] Auto-updating feed for {project_id}...")
+                # Обновляем статус успеха
+                await self.redis.hset(
+                    f"project:{project_id}:feed",
+                    mapping={
+                        "status": "success",
+                        "progress": "100",
+                        "message": f"Загружено {result['products_count']} товаров",
+                        "products_count": str(result["products_count"]),
+                        "categories_count": str(result["categories_count"]),
+                        "last_update": datetime.utcnow().isoformat(),
+                        "last_auto_update": datetime.utcnow().isoformat(),
+                        "auto_update_status": "success"
+                    }
+                )
                 
-                # Устанавливаем статус "downloading"
+                logger.info("[Scheduler] Updated %s products for %s", result["products_count"], project_id)
+                return True
+            else:
+                # Сохраняем ошибку
                 await self.redis.hset(
                     f"project:{project_id}:feed",
                     mapping={
-                        "status": "downloading",
+                        "status": "error",
                         "progress": "0",
-                        "message": "Автообновление фида...",
-                        "update_started": now.isoformat()
+                        "message": result.get("error", "Ошибка загрузки"),
+                        "last_auto_update": datetime.utcnow().isoformat(),
+                        "auto_update_status": "error"
                     }
                 )
+                logger.warning("[Scheduler] Failed to update %s: %s", project_id, result.get("error"))
                 
-                try:
-                    # Загружаем фид
-                    result = await self.feed_manager.load_feed(project_id, feed_url)
-                    
-                    if result["success"]:
-                        # Статус индексации
-                        await self.redis.hset(
-                            f"project:{project_id}:feed",
-                            mapping={
-                                "status": "indexing",
-                                "progress": "50",
-                                "message": f"Индексация {result['products_count']} товаров..."
-                            }
-                        )
-                        
-                        # Сохраняем товары
-                        await self.data_store.save_products(project_id, result["products"])
-                        
-                        # Конвертируем и индексируем
-                        products_list = []
-                        for p in result["products"]:
-                            try:
-                                product = Product(
-                                    id=str(p.get("id", "")),
-                                    name=p.get("name", ""),
-                                    url=p.get("url", ""),
-                                    description=p.get("description"),
-                                    image=p.get("image"),
-                                    images=p.get("images", []),
-                                    price=float(p.get("price", 0) or 0),
-                                    old_price=float(p.get("old_price") or 0) if p.get("old_price") else None,
-                                    in_stock=p.get("in_stock", True),
-                                    category=p.get("category"),
-                                    brand=p.get("brand"),
-                                    vendor_code=p.get("vendor_code"),
-                                    params=p.get("params", {}),
-                                )
-                                products_list.append(product)
-                            except:
-                                continue
-                        
-                        await self.indexer.index_products(project_id, products_list)
-                        
-                        # Обновляем статус успеха
-                        await self.redis.hset(
-                            f"project:{project_id}:feed",
-                            mapping={
-                                "status": "success",
-                                "progress": "100",
-                                "message": f"Загружено {result['products_count']} товаров",
-                                "products_count": str(result["products_count"]),
-                                "categories_count": str(result["categories_count"]),
-                                "last_update": datetime.utcnow().isoformat(),
-                                "last_auto_update": datetime.utcnow().isoformat(),
-                                "auto_update_status": "success"
-                            }
-                        )
-                        
-                        updated_count += 1
-                        print(f"[Scheduler] ✓ Updated {result['products_count']} products for {project_id}")
-                    else:
-                        # Сохраняем ошибку
-                        await self.redis.hset(
-                            f"project:{project_id}:feed",
-                            mapping={
-                                "status": "error",
-                                "progress": "0",
-                                "message": result.get("error", "Ошибка загрузки"),
-                                "last_auto_update": datetime.utcnow().isoformat(),
-                                "auto_update_status": "error"
-                            }
-                        )
-                        print(f"[Scheduler] ✗ Failed to update {project_id}: {result.get('error')}")
-                        
-                except Exception as e:
-                    await self.redis.hset(
-                        f"project:{project_id}:feed",
-                        mapping={
-                            "status": "error",
-                            "progress": "0",
-                            "message": str(e),
-                            "last_auto_update": datetime.utcnow().isoformat(),
-                            "auto_update_status": "error"
-                        }
-                    )
-                    print(f"[Scheduler] ✗ Error updating {project_id}: {e}")
-                
-            except Exception as e:
-                print(f"[Scheduler] Error checking project: {e}")
+        except Exception as e:
+            await self.redis.hset(
+                f"project:{project_id}:feed",
+                mapping={
+                    "status": "error",
+                    "progress": "0",
+                    "message": str(e),
+                    "last_auto_update": datetime.utcnow().isoformat(),
+                    "auto_update_status": "error"
+                }
+            )
+            logger.error("[Scheduler] Error updating %s: %s", project_id, e)
         
-        if updated_count > 0:
-            print(f"[Scheduler] Completed: {updated_count} feeds updated")
+        return False
 
 
 # Глобальный экземпляр
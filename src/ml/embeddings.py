@@ -7,11 +7,53 @@ Embeddings - векторные представления текста
 - paraphrase-multilingual-MiniLM: баланс скорости и качества
 """
 import numpy as np
-from typing import List, Optional, Union, Dict, Any
+from typing import List, Optional, Union, Dict, Any, Tuple
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
+import asyncio
 import hashlib
 import json
+import logging
+import struct
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _quantize_embeddings(embeddings: np.ndarray) -> List[bytes]:
+    """
+    Embeddings [n, dimension] -> int8 с общим масштабом на вектор: 4 байта
+    масштаба (float32) + по байту на измерение, вчетверо меньше float32
+
+    Масштабы и округление считаются сразу по всей матрице, в одном
+    рабочем буфере - без временных массивов на каждый вектор.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / np.float32(127.0)
+    scales[scales == 0] = 1.0
+    
+    work = embeddings / scales[:, None]
+    np.rint(work, out=work)
+    quantized = work.astype(np.int8)
+    
+    return [
+        struct.pack("<f", scale) + row.tobytes()
+        for scale, row in zip(scales.tolist(), quantized)
+    ]
+
+
+def _dequantize_embedding(data: bytes, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Обратное к _quantize_embeddings: float32 вектор
+
+    С out результат пишется прямо в переданный массив (например, строку
+    общей матрицы) без промежуточной копии.
+    """
+    (scale,) = struct.unpack_from("<f", data)
+    quantized = np.frombuffer(data, dtype=np.int8, offset=4)
+    if out is None:
+        return quantized.astype(np.float32) * np.float32(scale)
+    return np.multiply(quantized, np.float32(scale), out=out)
 
 
 @dataclass
@@ -23,9 +65,11 @@ class EmbeddingConfig:
     batch_size: int = 32
     normalize: bool = True
     device: str = "cpu"  # cpu, cuda, cuda:0
+    half_precision: bool = True  # FP16 веса на GPU (на CPU игнорируется)
     cache_enabled: bool = True
     prefix_query: str = "query: "  # Для E5 моделей
     prefix_passage: str = "passage: "
+    onnx_path: Optional[str] = None  # Экспортированная ONNX модель для OnnxEmbeddingModel
 
 
 class EmbeddingModel(ABC):
@@ -83,6 +127,11 @@ class SentenceTransformerModel(EmbeddingModel):
                     device=self.config.device
                 )
                 
+                # На GPU FP16 вдвое поднимает пропускную способность
+                # tensor cores; точности для cosine similarity хватает
+                if self.config.half_precision and self.config.device.startswith("cuda"):
+                    self._model.half()
+                
                 # Обновляем реальную размерность
                 self._dimension = self._model.get_sentence_embedding_dimension()
                 
@@ -120,6 +169,110 @@ class SentenceTransformerModel(EmbeddingModel):
             convert_to_numpy=True
         )
         
+        # После half() дальше (кэш, compute_similarity) всё равно float32
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+
+class OnnxEmbeddingModel(EmbeddingModel):
+    """
+    Модель на ONNX Runtime (CPU)
+    
+    Тот же трансформер, что и в SentenceTransformerModel, но экспортированный
+    в ONNX: ONNX Runtime сливает операции внимания и считает через oneDNN,
+    а int8 веса (см. quantize) используют VNNI. На CPU в 2-4 раза быстрее
+    PyTorch eager при меньшем потреблении памяти.
+    
+    Токенизатор - Rust библиотека tokenizers (tokenizer.json модели),
+    пулинг (mean по attention_mask) и нормализация - в numpy.
+    """
+    
+    def __init__(self, config: EmbeddingConfig):
+        if not config.onnx_path:
+            raise ValueError("EmbeddingConfig.onnx_path is required for OnnxEmbeddingModel")
+        
+        self.config = config
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._dimension = config.dimension
+    
+    def _load_model(self):
+        """Ленивая загрузка сессии и токенизатора"""
+        if self._session is None:
+            try:
+                import onnxruntime
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise ImportError(
+                    "onnxruntime/tokenizers not installed. "
+                    "Run: pip install onnxruntime tokenizers"
+                )
+            
+            self._tokenizer = Tokenizer.from_pretrained(self.config.model_name)
+            self._tokenizer.enable_truncation(max_length=self.config.max_length)
+            self._tokenizer.enable_padding()
+            
+            self._session = onnxruntime.InferenceSession(
+                self.config.onnx_path,
+                providers=["CPUExecutionProvider"]
+            )
+            # token_type_ids есть не у всех моделей - подаём только то,
+            # что модель принимает
+            self._input_names = tuple(i.name for i in self._session.get_inputs())
+    
+    @staticmethod
+    def quantize(model_path: str, output_path: str) -> None:
+        """
+        Динамическая int8 квантизация весов экспортированной ONNX модели
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    
+    def encode(
+        self, 
+        texts: Union[str, List[str]], 
+        is_query: bool = True
+    ) -> np.ndarray:
+        self._load_model()
+        
+        if isinstance(texts, str):
+            texts = [texts]
+        
+        # Добавляем префиксы для E5 моделей
+        if "e5" in self.config.model_name.lower():
+            prefix = self.config.prefix_query if is_query else self.config.prefix_passage
+            texts = [prefix + t for t in texts]
+        
+        batches = []
+        for i in range(0, len(texts), self.config.batch_size):
+            encodings = self._tokenizer.encode_batch(texts[i:i + self.config.batch_size])
+            
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self._session.run(
+                None,
+                {name: feed[name] for name in self._input_names}
+            )[0]
+            
+            # Mean pooling без паддинга
+            mask = feed["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled.astype(np.float32))
+        
+        embeddings = np.concatenate(batches) if batches else np.empty((0, self._dimension), dtype=np.float32)
+        self._dimension = embeddings.shape[1]
+        
+        if self.config.normalize:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        
         return embeddings
     
     @property
@@ -144,18 +297,21 @@ class MockEmbeddingModel(EmbeddingModel):
         if isinstance(texts, str):
             texts = [texts]
         
-        embeddings = []
-        for text in texts:
-            # Генерируем псевдо-случайный вектор на основе хэша
-            hash_bytes = hashlib.sha256(text.encode()).digest()
-            # Расширяем до нужной размерности
-            np.random.seed(int.from_bytes(hash_bytes[:4], 'big'))
-            embedding = np.random.randn(self._dimension).astype(np.float32)
-            # Нормализуем
-            embedding = embedding / np.linalg.norm(embedding)
-            embeddings.append(embedding)
+        # Псевдо-случайный вектор из хэша текста: SHAKE-128 растягивается
+        # до 4 байт на измерение - без пересева глобального генератора numpy
+        size = self._dimension * 4
+        buffer = b"".join(
+            hashlib.shake_128(text.encode()).digest(size) for text in texts
+        )
+        
+        # Весь батч - одним массивом: uint32 -> [-1, 1) -> единичная длина
+        # Приведение к float32 слито с масштабированием, дальше - на месте
+        embeddings = np.frombuffer(buffer, dtype=np.uint32).reshape(len(texts), self._dimension)
+        embeddings = np.multiply(embeddings, np.float32(2.0 / 2**32), dtype=np.float32)
+        embeddings -= np.float32(1.0)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
         
-        return np.array(embeddings)
+        return embeddings
     
     @property
     def dimension(self) -> int:
@@ -172,23 +328,69 @@ class EmbeddingService:
     - Асинхронная генерация
     """
     
+    # Сколько embeddings запросов держать в памяти процесса (LRU)
+    QUERY_CACHE_SIZE = 4096
+    
     def __init__(
         self, 
         model: EmbeddingModel,
         redis_client=None,
-        cache_ttl: int = 86400 * 7  # 7 дней
+        cache_ttl: int = 86400 * 7,  # 7 дней
+        query_cache_ttl: int = 86400
     ):
         self.model = model
         self.redis = redis_client
         self.cache_ttl = cache_ttl
+        self.query_cache_ttl = query_cache_ttl
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        
+        config = getattr(model, "config", None)
+        self._model_key = getattr(config, "model_name", type(model).__name__)
     
     async def encode_query(self, query: str) -> np.ndarray:
         """
         Кодирование поискового запроса
+        
+        Популярные запросы повторяются у многих пользователей, а инференс -
+        основная задержка короткого запроса: embeddings кэшируются в LRU
+        процесса и в Redis (общий для воркеров). Ошибка Redis - просто
+        промах кэша. Возвращаемый массив только для чтения - он общий
+        для всех обращений.
         """
-        # Для запросов обычно не кэшируем (они уникальны)
-        embedding = self.model.encode(query, is_query=True)
-        return embedding[0]  # Возвращаем 1D массив
+        embedding = self._query_cache.get(query)
+        if embedding is not None:
+            self._query_cache.move_to_end(query)
+            return embedding
+        
+        cache_key = self._query_cache_key(query) if self.redis else None
+        data = None
+        if cache_key:
+            try:
+                data = await self.redis.get(cache_key)
+            except Exception as e:
+                logger.warning("[Embeddings] query cache read failed: %s", e)
+        
+        if data:
+            embedding = _dequantize_embedding(data)
+        else:
+            # Инференс - в потоке, чтобы не блокировать event loop
+            embedding = (await asyncio.to_thread(self.model.encode, query, is_query=True))[0]  # 1D массив
+            if cache_key:
+                try:
+                    await self.redis.setex(
+                        cache_key,
+                        self.query_cache_ttl,
+                        _quantize_embeddings(embedding[None, :])[0]
+                    )
+                except Exception as e:
+                    logger.warning("[Embeddings] query cache write failed: %s", e)
+        
+        embedding.flags.writeable = False
+        self._query_cache[query] = embedding
+        if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        
+        return embedding
     
     async def encode_products(
         self, 
@@ -203,36 +405,68 @@ class EmbeddingService:
             text_field: Поле для извлечения текста
             
         Returns:
-            Словарь {product_id: embedding}
+            Словарь {product_id: embedding}; значения - строки одной
+            матрицы из encode_products_matrix
         """
-        result = {}
-        to_encode = []
-        to_encode_ids = []
+        product_ids, matrix = await self.encode_products_matrix(products, text_field)
+        return dict(zip(product_ids, matrix))
+    
+    async def encode_products_matrix(
+        self, 
+        products: List[Dict[str, Any]],
+        text_field: str = "search_text"
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        Кодирование товаров с кэшированием в одну матрицу
+        
+        Embeddings из кэша и только что посчитанные пишутся в общий
+        непрерывный float32 массив - без отдельного массива на товар;
+        матрицу можно сразу передавать в compute_similarity.
         
-        for product in products:
-            product_id = product["id"]
-            text = self._get_product_text(product, text_field)
+        Args:
+            products: Список товаров
+            text_field: Поле для извлечения текста
             
-            # Проверяем кэш
-            cached = await self._get_cached_embedding(product_id, text)
-            if cached is not None:
-                result[product_id] = cached
-            else:
-                to_encode.append(text)
-                to_encode_ids.append(product_id)
+        Returns:
+            (product_ids, matrix): matrix[i] - embedding товара product_ids[i],
+            порядок совпадает с products
+        """
+        product_ids = [product["id"] for product in products]
+        texts = [self._get_product_text(product, text_field) for product in products]
+        # Ключ (с хэшем текста) считается один раз - и для чтения,
+        # и для записи в кэш
+        keys = [
+            self._cache_key(product_id, text)
+            for product_id, text in zip(product_ids, texts)
+        ] if self.redis else [None] * len(products)
+        
+        # Проверяем кэш - все ключи одним MGET
+        cached = await self._get_cached_embeddings(keys)
+        
+        hits = [i for i, data in enumerate(cached) if data]
+        misses = [i for i, data in enumerate(cached) if not data]
         
         # Кодируем некэшированные
-        if to_encode:
-            embeddings = self.model.encode(to_encode, is_query=False)
+        embeddings = None
+        if misses:
+            embeddings = self.model.encode([texts[i] for i in misses], is_query=False)
+            dimension = embeddings.shape[1]
+        elif hits:
+            # Размерность - по записи кэша: 4 байта масштаба + int8 на измерение
+            dimension = len(cached[hits[0]]) - 4
+        else:
+            dimension = self.model.dimension
+        
+        matrix = np.empty((len(products), dimension), dtype=np.float32)
+        for i in hits:
+            _dequantize_embedding(cached[i], out=matrix[i])
+        if misses:
+            matrix[misses] = embeddings
             
-            for i, product_id in enumerate(to_encode_ids):
-                embedding = embeddings[i]
-                result[product_id] = embedding
-                
-                # Сохраняем в кэш
-                await self._cache_embedding(product_id, to_encode[i], embedding)
+            # Сохраняем в кэш
+            await self._cache_embeddings([keys[i] for i in misses], embeddings)
         
-        return result
+        return product_ids, matrix
     
     def _get_product_text(self, product: Dict, text_field: str) -> str:
         """
@@ -260,71 +494,112 @@ class EmbeddingService:
         
         return " ".join(parts)
     
-    async def _get_cached_embedding(
+    @staticmethod
+    def _cache_key(product_id: str, text: str) -> str:
+        """
+        Ключ кэша embedding товара
+        
+        Включает хэш текста для инвалидации при изменении: blake2b на
+        коротких текстах быстрее md5 и даёт 64 бита вместо 32.
+        emb8: - int8 формат; старые float32 записи под emb: не читаются
+        и истекают по TTL.
+        """
+        text_hash = hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+        return f"emb8:{product_id}:{text_hash}"
+    
+    def _query_cache_key(self, query: str) -> str:
+        """Ключ кэша embedding запроса: модель + хэш текста"""
+        query_hash = hashlib.blake2b(query.encode(), digest_size=8).hexdigest()
+        return f"qemb8:{self._model_key}:{query_hash}"
+    
+    async def _get_cached_embeddings(
         self, 
-        product_id: str, 
-        text: str
-    ) -> Optional[np.ndarray]:
-        """Получение embedding из кэша"""
-        if not self.redis:
-            return None
-        
-        # Ключ включает хэш текста для инвалидации при изменении
-        text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-        cache_key = f"emb:{product_id}:{text_hash}"
-        
-        data = await self.redis.get(cache_key)
-        if data:
-            return np.frombuffer(data, dtype=np.float32)
+        cache_keys: List[Optional[str]]
+    ) -> List[Optional[bytes]]:
+        """
+        Получение сырых записей кэша по ключам из _cache_key
         
-        return None
+        Один MGET на все ключи - один round-trip вместо GET на товар.
+        Для промахов в списке None; декодирует _dequantize_embedding.
+        Ошибка Redis - промах по всем ключам.
+        """
+        if not self.redis or not cache_keys:
+            return [None] * len(cache_keys)
+        
+        try:
+            return await self.redis.mget(cache_keys)
+        except Exception as e:
+            logger.warning("[Embeddings] cache read failed: %s", e)
+            return [None] * len(cache_keys)
     
-    async def _cache_embedding(
+    async def _cache_embeddings(
         self, 
-        product_id: str, 
-        text: str, 
-        embedding: np.ndarray
+        cache_keys: List[Optional[str]], 
+        embeddings: np.ndarray
     ):
-        """Сохранение embedding в кэш"""
-        if not self.redis:
+        """Сохранение embeddings в кэш одним pipeline"""
+        if not self.redis or not cache_keys:
             return
         
-        text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-        cache_key = f"emb:{product_id}:{text_hash}"
-        
-        await self.redis.setex(
-            cache_key,
-            self.cache_ttl,
-            embedding.astype(np.float32).tobytes()
-        )
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for cache_key, data in zip(cache_keys, _quantize_embeddings(embeddings)):
+                pipe.setex(cache_key, self.cache_ttl, data)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("[Embeddings] cache write failed: %s", e)
     
     def compute_similarity(
         self, 
         query_embedding: np.ndarray, 
-        product_embeddings: np.ndarray
+        product_embeddings: np.ndarray,
+        normalized: bool = True
     ) -> np.ndarray:
         """
         Вычисление косинусного сходства
         
         Args:
-            query_embedding: [dimension]
+            query_embedding: [dimension] или батч запросов [n_queries, dimension]
             product_embeddings: [n_products, dimension]
+            normalized: Векторы уже единичной длины (как отдаёт модель
+                с normalize=True); иначе скалярные произведения делятся
+                на нормы
             
         Returns:
-            Массив scores [n_products]
+            Массив scores [n_products] для одного запроса,
+            [n_products, n_queries] для батча
         """
-        # Для нормализованных векторов cosine similarity = dot product
-        if len(query_embedding.shape) == 1:
-            query_embedding = query_embedding.reshape(1, -1)
+        # Оба операнда во float32: при смешанных типах numpy приводит
+        # к float64 копию всей матрицы товаров и считает без sgemm
+        products = np.asarray(product_embeddings, dtype=np.float32)
+        queries = np.asarray(query_embedding, dtype=np.float32)
+        
+        # Для нормализованных векторов cosine similarity = dot product.
+        # Батч запросов - одно умножение матриц (BLAS GEMM) вместо
+        # отдельного прохода по матрице товаров на каждый запрос
+        if queries.ndim == 1:
+            scores = products @ queries
+        else:
+            scores = products @ queries.T
+        
+        if not normalized:
+            # Нормы - через einsum без временной копии матрицы товаров,
+            # деление - на месте в уже посчитанных scores
+            product_norms = np.sqrt(np.einsum("ij,ij->i", products, products))
+            query_norms = np.sqrt(np.einsum("...j,...j->...", queries, queries))
+            np.maximum(product_norms, np.float32(1e-12), out=product_norms)
+            query_norms = np.maximum(query_norms, np.float32(1e-12))
+            scores /= product_norms[:, None] if scores.ndim == 2 else product_norms
+            scores /= query_norms
         
-        scores = np.dot(product_embeddings, query_embedding.T).flatten()
         return scores
 
 
 def create_embedding_model(
     model_name: str = "auto",
     device: str = "cpu",
-    use_mock: bool = False
+    use_mock: bool = False,
+    onnx_path: Optional[str] = None
 ) -> EmbeddingModel:
     """
     Фабрика для создания модели embeddings
@@ -333,6 +608,8 @@ def create_embedding_model(
         model_name: Название модели или "auto" для автовыбора
         device: Устройство (cpu, cuda)
         use_mock: Использовать mock модель (для тестов)
+        onnx_path: Путь к ONNX экспорту модели - на CPU вместо
+            sentence-transformers используется OnnxEmbeddingModel
     
     Returns:
         EmbeddingModel instance
@@ -366,7 +643,11 @@ def create_embedding_model(
     config = EmbeddingConfig(
         model_name=model_name,
         dimension=dimension,
-        device=device
+        device=device,
+        onnx_path=onnx_path
     )
     
+    if onnx_path and device == "cpu":
+        return OnnxEmbeddingModel(config)
+    
     return SentenceTransformerModel(config)
@@ -6,13 +6,17 @@ Hybrid Search Engine - гибридный поиск с ML
 2. Vector Search (semantic) - семантический поиск по embeddings
 3. Neural Re-ranker - переранжирование топ-N результатов
 """
+import asyncio
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Awaitable, List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
+import dataclasses
 import time
 
-from .embeddings import EmbeddingService, EmbeddingModel
-from .reranker import NeuralReranker
+from .embeddings import (
+    EmbeddingService, EmbeddingModel, _quantize_embeddings, _dequantize_embedding
+)
+from .reranker import NeuralReranker, RerankBatcher
 from .spell_checker import SpellChecker
 
 
@@ -36,6 +40,14 @@ class HybridSearchConfig:
     
     # RRF (Reciprocal Rank Fusion) параметр
     rrf_k: int = 60
+    
+    # Пропуск re-ranker для запросов, где порядок и так очевиден
+    # (used_reranker=False в результате - по нему подбираются пороги):
+    # - отрыв RRF score первого товара от второго больше skip_rerank_gap
+    #   (максимум RRF score - 2 / (rrf_k + 1), ~0.033 при k=60)
+    # - однословный запрос, а первый товар - первый в BM25
+    skip_rerank_gap: Optional[float] = None
+    skip_rerank_single_word: bool = False
 
 
 @dataclass
@@ -70,6 +82,9 @@ class HybridSearchEngine:
     5. Neural re-ranker -> top-20
     """
     
+    # Сколько секунд держать в памяти векторы проекта для brute-force поиска
+    VECTORS_CACHE_TTL = 60
+    
     def __init__(
         self,
         bm25_searcher,  # Существующий BM25 поиск (SearchEngine)
@@ -77,7 +92,8 @@ class HybridSearchEngine:
         reranker: Optional[NeuralReranker] = None,
         spell_checker: Optional[SpellChecker] = None,
         vector_store=None,  # Qdrant/Redis Vector client
-        config: Optional[HybridSearchConfig] = None
+        config: Optional[HybridSearchConfig] = None,
+        redis_client=None  # Кэш scores re-ranker
     ):
         self.bm25_searcher = bm25_searcher
         self.embedding_service = embedding_service
@@ -85,6 +101,22 @@ class HybridSearchEngine:
         self.spell_checker = spell_checker
         self.vector_store = vector_store
         self.config = config or HybridSearchConfig()
+        
+        # Векторы проектов для _brute_force_vector_search:
+        # project_id -> (время загрузки, payloads, matrix)
+        self._vectors_cache: Dict[str, Tuple[float, List[Dict[str, Any]], np.ndarray]] = {}
+        
+        # Cross-encoder со score_pairs - через общий батч для параллельных
+        # запросов; остальные re-rankers вызываются напрямую
+        self._rerank_batcher = (
+            RerankBatcher(reranker, redis_client=redis_client)
+            if hasattr(reranker, 'score_pairs') else None
+        )
+        
+        # 1 / (k + rank) для всех возможных рангов: ранг ограничен top_k
+        # списков, k постоянен - считаем один раз, индекс таблицы = ранг
+        max_rank = max(self.config.bm25_top_k, self.config.vector_top_k)
+        self._rrf_table = 1.0 / (self.config.rrf_k + np.arange(max_rank + 1, dtype=np.float64))
     
     async def search(
         self,
@@ -100,60 +132,101 @@ class HybridSearchEngine:
         """
         start_time = time.time()
         
-        # 1. Spell correction
-        corrected_query = query
-        spell_corrected = False
-        
-        if self.config.use_spell_check and self.spell_checker:
-            spell_result = self.spell_checker.check(query)
-            if spell_result.was_corrected:
-                corrected_query = spell_result.corrected
-                spell_corrected = True
-        
-        # 2. BM25 Search
-        bm25_start = time.time()
-        bm25_results = await self._bm25_search(
-            project_id, 
-            corrected_query, 
-            self.config.bm25_top_k,
-            filters
+        use_vector = bool(
+            self.config.use_vector_search and self.embedding_service and self.vector_store
+        )
+        
+        # Embedding запроса считается, пока идёт проверка орфографии:
+        # исправление нужно редко, тогда запрос кодируется заново
+        embed_task = (
+            asyncio.create_task(self.embedding_service.encode_query(query))
+            if use_vector else None
         )
-        bm25_time = int((time.time() - bm25_start) * 1000)
-        
-        # 3. Vector Search (если включено)
-        vector_results = []
-        vector_time = 0
-        used_vector = False
-        
-        if self.config.use_vector_search and self.embedding_service and self.vector_store:
-            vector_start = time.time()
-            vector_results = await self._vector_search(
-                project_id,
-                corrected_query,
-                self.config.vector_top_k,
+        
+        try:
+            # 1. Spell correction
+            corrected_query = query
+            spell_corrected = False
+            
+            if self.config.use_spell_check and self.spell_checker:
+                spell_result = await asyncio.to_thread(self.spell_checker.check, query)
+                if spell_result.was_corrected:
+                    corrected_query = spell_result.corrected
+                    spell_corrected = True
+            
+                    if embed_task:
+                        embed_task.cancel()
+                        embed_task = asyncio.create_task(
+                            self.embedding_service.encode_query(corrected_query)
+                        )
+            
+            # 2. BM25 Search
+            bm25 = self._timed(self._bm25_search(
+                project_id, 
+                corrected_query, 
+                self.config.bm25_top_k,
                 filters
-            )
-            vector_time = int((time.time() - vector_start) * 1000)
-            used_vector = True
+            ))
+            
+            # 3. Vector Search (если включено) - параллельно с BM25, они
+            # независимы: общее время - максимум из двух, а не сумма
+            vector_results = []
+            vector_time = 0
+            used_vector = False
+            
+            if use_vector:
+                async def vector_search() -> List[Dict[str, Any]]:
+                    return await self._vector_search(
+                        project_id,
+                        corrected_query,
+                        self.config.vector_top_k,
+                        filters,
+                        query_embedding=await embed_task
+                    )
+            
+                (bm25_results, bm25_time), (vector_results, vector_time) = await asyncio.gather(
+                    bm25,
+                    self._timed(vector_search())
+                )
+                used_vector = True
+            else:
+                bm25_results, bm25_time = await bm25
+            
+        finally:
+            # При ошибке проверки орфографии или BM25 задача embedding
+            # не дожидается - отменяем её, а не оставляем висеть
+            if embed_task is not None:
+                self._discard_task(embed_task)
         
         # 4. Merge results with RRF
+        # Сортируем и собираем только то, что дальше понадобится: первые
+        # rerank_top_k для re-ranker или товары до конца запрошенной страницы
+        use_reranker = bool(self.config.use_reranker and self.reranker)
         if vector_results:
-            merged = self._merge_results_rrf(bm25_results, vector_results)
+            merged, total = self._merge_results_rrf(
+                bm25_results,
+                vector_results,
+                top_k=self.config.rerank_top_k if use_reranker else offset + limit
+            )
         else:
             merged = bm25_results
+            total = len(merged)
         
         # 5. Neural Re-ranker (если включено)
         rerank_time = 0
         used_reranker = False
         
-        if self.config.use_reranker and self.reranker and len(merged) > 0:
+        if use_reranker and self._should_skip_rerank(corrected_query, merged):
+            merged = merged[:self.config.final_top_k]
+            total = len(merged)
+        elif use_reranker and len(merged) > 0:
             rerank_start = time.time()
-            merged = self._rerank_results(corrected_query, merged)
+            merged = await self._rerank_results(corrected_query, merged)
+            total = len(merged)
             rerank_time = int((time.time() - rerank_start) * 1000)
             used_reranker = True
         
         # 6. Pagination
-        total = len(merged)
         items = merged[offset:offset + limit]
         
         total_time = int((time.time() - start_time) * 1000)
@@ -172,6 +245,21 @@ class HybridSearchEngine:
             used_reranker=used_reranker
         )
     
+    @staticmethod
+    def _discard_task(task: asyncio.Task) -> None:
+        """Отмена незавершённой задачи; ошибка завершённой помечается прочитанной"""
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+    
+    @staticmethod
+    async def _timed(coro: Awaitable) -> Tuple[Any, int]:
+        """Результат корутины и время её выполнения в мс"""
+        start = time.time()
+        result = await coro
+        return result, int((time.time() - start) * 1000)
+    
     async def _bm25_search(
         self,
         project_id: str,
@@ -190,8 +278,10 @@ class HybridSearchEngine:
         # Преобразуем в список dict с рангом
         items = []
         for i, product in enumerate(result.items):
-            item = product.__dict__ if hasattr(product, '__dict__') else product
-            item = dict(item)
+            if dataclasses.is_dataclass(product):
+                item = {f.name: getattr(product, f.name) for f in dataclasses.fields(product)}
+            else:
+                item = dict(product)
             item['_bm25_rank'] = i + 1
             item['_bm25_score'] = 1.0 / (i + 1)  # Simple score
             items.append(item)
@@ -203,11 +293,13 @@ class HybridSearchEngine:
         project_id: str,
         query: str,
         limit: int,
-        filters: Optional[Dict]
+        filters: Optional[Dict],
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
-        """Векторный поиск"""
+        """Векторный поиск; query_embedding - уже посчитанный embedding запроса"""
         # Получаем embedding запроса
-        query_embedding = await self.embedding_service.encode_query(query)
+        if query_embedding is None:
+            query_embedding = await self.embedding_service.encode_query(query)
         
         # Поиск в vector store
         # Это пример для Qdrant, адаптируйте под ваш vector store
@@ -256,21 +348,181 @@ class HybridSearchEngine:
         
         # Fallback: простой brute-force поиск в Redis
         return await self._brute_force_vector_search(
-            project_id, query_embedding, limit
+            project_id, query_embedding, limit, filters
         )
     
     async def _brute_force_vector_search(
         self,
         project_id: str,
         query_embedding: np.ndarray,
-        limit: int
+        limit: int,
+        filters: Optional[Dict] = None
     ) -> List[Dict[str, Any]]:
         """
         Простой векторный поиск (для небольших коллекций)
+        
+        Fallback для vector_store без search - клиента Redis без модуля
+        RediSearch (и без decode_responses: embedding хранится бинарно).
+        Точки лежат в hash-ах {collection}:{id} в формате RedisVectorStore;
+        VectorIndexer пишет вектор в int8 (поле embedding_i8).
+        Все векторы собираются в одну float32 матрицу, scores - одним
+        умножением матрицы на вектор (BLAS), топ - через argpartition.
+        Фильтры применяются маской по payload до выбора топа.
+        В реальности используйте Redis Vector Search или Qdrant.
+        """
+        payloads, matrix = await self._get_vectors(project_id)
+        if not payloads:
+            return []
+        
+        rows = None
+        if filters:
+            mask = self._filter_mask(payloads, filters)
+            if mask is None:
+                # Фильтр, который здесь не проверить: лучше без векторных
+                # кандидатов, чем с товарами, не прошедшими фильтр
+                return []
+            rows = np.flatnonzero(mask)
+            matrix = matrix[rows]
+        
+        # Сортируем только limit лучших
+        limit = min(limit, len(matrix))
+        if limit <= 0:
+            return []
+        
+        scores = self.embedding_service.compute_similarity(
+            query_embedding, matrix, normalized=False
+        )
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        
+        indices = rows[top] if rows is not None else top
+        return [
+            {**payloads[i], '_score': float(scores[j])}
+            for i, j in zip(indices.tolist(), top.tolist())
+        ]
+    
+    # Фильтры, которые _filter_mask умеет проверять по payload
+    VECTOR_FILTER_KEYS = frozenset({'in_stock', 'price_min', 'price_max', 'category', 'brand'})
+    
+    def _filter_mask(
+        self,
+        payloads: List[Dict[str, Any]],
+        filters: Dict[str, Any]
+    ) -> Optional[np.ndarray]:
         """
-        # Получаем все embeddings из Redis
-        # В реальности используйте Redis Vector Search или Qdrant
-        return []
+        Маска точек, проходящих фильтры (семантика как в BM25 движке)
+        
+        Returns:
+            None, если среди фильтров есть неизвестные
+        """
+        active = {k: v for k, v in filters.items() if v is not None}
+        if not active.keys() <= self.VECTOR_FILTER_KEYS:
+            return None
+        
+        mask = np.ones(len(payloads), dtype=bool)
+        
+        if active.get('in_stock'):
+            mask &= np.fromiter((bool(p.get('in_stock')) for p in payloads), bool, len(payloads))
+        
+        if 'price_min' in active or 'price_max' in active:
+            prices = np.fromiter(
+                (float(p.get('price') or 0) for p in payloads), np.float64, len(payloads)
+            )
+            if 'price_min' in active:
+                mask &= prices >= active['price_min']
+            if 'price_max' in active:
+                mask &= prices <= active['price_max']
+        
+        if 'category' in active:
+            category = str(active['category']).lower()
+            mask &= np.fromiter(
+                (bool(p.get('category')) and category in p['category'].lower() for p in payloads),
+                bool, len(payloads)
+            )
+        
+        if 'brand' in active:
+            brand = str(active['brand']).lower()
+            mask &= np.fromiter(
+                (bool(p.get('brand')) and p['brand'].lower() == brand for p in payloads),
+                bool, len(payloads)
+            )
+        
+        return mask
+    
+    async def _get_vectors(
+        self,
+        project_id: str
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """
+        Векторы проекта из памяти процесса; из Redis перечитываются не
+        чаще раза в VECTORS_CACHE_TTL секунд, а не на каждый запрос
+        """
+        cached = self._vectors_cache.get(project_id)
+        if cached and time.monotonic() - cached[0] < self.VECTORS_CACHE_TTL:
+            return cached[1], cached[2]
+        
+        payloads, matrix = await self._load_vectors(project_id)
+        self._vectors_cache[project_id] = (time.monotonic(), payloads, matrix)
+        return payloads, matrix
+    
+    async def _load_vectors(
+        self,
+        project_id: str
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """
+        Загрузка всех точек проекта из Redis: (payloads, matrix),
+        matrix[i] - вектор точки payloads[i]
+        """
+        collection_name = f"products_{project_id}"
+        keys = [
+            key async for key in
+            self.vector_store.scan_iter(match=f"{collection_name}:*", count=500)
+        ]
+        if not keys:
+            return [], np.empty((0, 0), dtype=np.float32)
+        
+        pipe = self.vector_store.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        hashes = await pipe.execute()
+        
+        payloads = []
+        vectors = []
+        for data in hashes:
+            data = {
+                (k.decode() if isinstance(k, bytes) else k): v
+                for k, v in data.items()
+            }
+            vector = data.pop('embedding', None)
+            quantized = data.pop('embedding_i8', None)
+            if not vector and not quantized:
+                continue
+            
+            payload = {
+                k: v.decode() if isinstance(v, bytes) else v
+                for k, v in data.items()
+            }
+            payload['price'] = float(payload['price']) if payload.get('price') else 0
+            payload['in_stock'] = payload.get('in_stock') == 'true'
+            
+            payloads.append(payload)
+            vectors.append((vector, quantized))
+        
+        if not vectors:
+            return [], np.empty((0, 0), dtype=np.float32)
+        
+        # Одна непрерывная матрица вместо массива на точку; int8 записи
+        # (4 байта масштаба + байт на измерение) декодируются прямо в строку
+        vector, quantized = vectors[0]
+        dimension = len(quantized) - 4 if quantized else len(vector) // 4
+        matrix = np.empty((len(vectors), dimension), dtype=np.float32)
+        for i, (vector, quantized) in enumerate(vectors):
+            if quantized:
+                _dequantize_embedding(quantized, out=matrix[i])
+            else:
+                matrix[i] = np.frombuffer(vector, dtype=np.float32)
+        
+        return payloads, matrix
     
     def _build_vector_filter(self, filters: Dict) -> Dict:
         """Построение фильтра для vector store"""
@@ -307,52 +559,96 @@ class HybridSearchEngine:
     def _merge_results_rrf(
         self,
         bm25_results: List[Dict],
-        vector_results: List[Dict]
-    ) -> List[Dict]:
+        vector_results: List[Dict],
+        top_k: Optional[int] = None
+    ) -> Tuple[List[Dict], int]:
         """
         Объединение результатов с помощью Reciprocal Rank Fusion
         
         RRF Score = Σ 1 / (k + rank)
         
         где k - параметр (обычно 60)
+        
+        С top_k возвращаются только top_k лучших - частичный выбор вместо
+        сортировки всего объединения, порядок тот же, что при полной.
+        
+        Returns:
+            (результаты, число уникальных товаров в объединении)
         """
         k = self.config.rrf_k
         
-        # Словарь для хранения RRF scores
-        rrf_scores: Dict[str, float] = {}
-        products: Dict[str, Dict] = {}
-        
-        # Обрабатываем BM25 результаты
-        for item in bm25_results:
-            product_id = item['id']
-            rank = item['_bm25_rank']
-            rrf_scores[product_id] = rrf_scores.get(product_id, 0) + (1.0 / (k + rank))
-            products[product_id] = item
-        
-        # Обрабатываем Vector результаты
-        for item in vector_results:
-            product_id = item['id']
-            rank = item['_vector_rank']
-            rrf_scores[product_id] = rrf_scores.get(product_id, 0) + (1.0 / (k + rank))
-            if product_id not in products:
-                products[product_id] = item
-            else:
-                # Обновляем vector score
-                products[product_id]['_vector_score'] = item.get('_vector_score', 0)
-        
-        # Сортируем по RRF score
-        sorted_ids = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)
+        # Позиция товара в объединённом списке (в порядке первого появления)
+        # и ранги всех вхождений; сами RRF scores считаются в numpy.
+        # Единственный словарь - id -> позиция, товары лежат списком
+        index: Dict[str, int] = {}
+        products: List[Dict] = []
+        positions: List[int] = []
+        ranks: List[int] = []
+        # Vector scores товаров, найденных и BM25 - проставляются только
+        # попавшим в результат
+        vector_scores: Dict[int, float] = {}
+        
+        # Один проход по BM25, затем по Vector результатам
+        for results, rank_key, is_vector in (
+            (bm25_results, '_bm25_rank', False),
+            (vector_results, '_vector_rank', True),
+        ):
+            for item in results:
+                position = index.setdefault(item['id'], len(products))
+                if position == len(products):
+                    products.append(item)
+                elif is_vector:
+                    vector_scores[position] = item.get('_vector_score', 0)
+                else:
+                    products[position] = item
+                positions.append(position)
+                ranks.append(item[rank_key])
+        
+        # RRF score = сумма 1 / (k + rank) по вхождениям товара
+        ranks = np.asarray(ranks, dtype=np.intp)
+        if ranks.size and ranks.max() < len(self._rrf_table):
+            contributions = self._rrf_table[ranks]
+        else:
+            contributions = 1.0 / (k + ranks.astype(np.float64))
+        rrf_scores = np.bincount(positions, weights=contributions, minlength=len(products))
+        
+        # Сортируем по RRF score (stable - при равенстве порядок появления)
+        if top_k is not None and top_k < len(rrf_scores):
+            # Кандидаты - все с score не ниже top_k-го (с учётом равных
+            # на границе), сортируются только они
+            threshold = np.partition(rrf_scores, -top_k)[-top_k] if top_k > 0 else np.inf
+            candidates = np.flatnonzero(rrf_scores >= threshold)
+            order = candidates[np.argsort(-rrf_scores[candidates], kind='stable')][:top_k].tolist()
+        else:
+            order = np.argsort(-rrf_scores, kind='stable').tolist()
         
-        # Формируем результат
+        # Формируем результат - трогаем только попавшие в него товары
         result = []
-        for product_id in sorted_ids:
-            item = products[product_id]
-            item['_rrf_score'] = rrf_scores[product_id]
+        for position, rrf_score in zip(order, rrf_scores[order].tolist()):
+            item = products[position]
+            if position in vector_scores:
+                item['_vector_score'] = vector_scores[position]
+            item['_rrf_score'] = rrf_score
             result.append(item)
         
-        return result
+        return result, len(products)
     
-    def _rerank_results(
+    def _should_skip_rerank(self, query: str, items: List[Dict]) -> bool:
+        """Можно ли не вызывать re-ranker (см. skip_rerank_* в конфиге)"""
+        if not items:
+            return False
+        
+        gap = self.config.skip_rerank_gap
+        if gap is not None and len(items) > 1 and '_rrf_score' in items[0]:
+            if items[0]['_rrf_score'] - items[1]['_rrf_score'] > gap:
+                return True
+        
+        if self.config.skip_rerank_single_word and len(query.split()) == 1:
+            return items[0].get('_bm25_rank') == 1
+        
+        return False
+    
+    async def _rerank_results(
         self,
         query: str,
         items: List[Dict]
@@ -364,12 +660,20 @@ class HybridSearchEngine:
         items_to_rerank = items[:self.config.rerank_top_k]
         
         # Применяем re-ranker
-        reranked = self.reranker.rerank_products(
-            query=query,
-            products=items_to_rerank,
-            text_field="name",
-            top_k=self.config.final_top_k
-        )
+        if self._rerank_batcher:
+            reranked = await self._rerank_batcher.rerank_products(
+                query=query,
+                products=items_to_rerank,
+                text_field="name",
+                top_k=self.config.final_top_k
+            )
+        else:
+            reranked = self.reranker.rerank_products(
+                query=query,
+                products=items_to_rerank,
+                text_field="name",
+                top_k=self.config.final_top_k
+            )
         
         return reranked
 
@@ -410,33 +714,38 @@ class VectorIndexer:
         for i in range(0, len(products), self.batch_size):
             batch = products[i:i + self.batch_size]
             
-            # Генерируем embeddings
-            embeddings = await self.embedding_service.encode_products(batch)
+            # Генерируем embeddings - строки matrix идут в порядке batch
+            product_ids, matrix = await self.embedding_service.encode_products_matrix(batch)
             
-            # Готовим точки для вставки
-            points = []
-            for product in batch:
-                product_id = product['id']
-                if product_id in embeddings:
-                    points.append({
-                        'id': product_id,
-                        'vector': embeddings[product_id].tolist(),
-                        'payload': {
-                            'id': product_id,
-                            'name': product.get('name', ''),
-                            'price': product.get('price', 0),
-                            'in_stock': product.get('in_stock', True),
-                            'category': product.get('category', ''),
-                            'brand': product.get('brand', ''),
-                            'url': product.get('url', ''),
-                            'image': product.get('image', ''),
-                        }
-                    })
+            payloads = [
+                {
+                    'id': product_id,
+                    'name': product.get('name', ''),
+                    'price': product.get('price', 0),
+                    'in_stock': product.get('in_stock', True),
+                    'category': product.get('category', ''),
+                    'brand': product.get('brand', ''),
+                    'url': product.get('url', ''),
+                    'image': product.get('image', ''),
+                }
+                for product, product_id in zip(batch, product_ids)
+            ]
+            if not payloads:
+                continue
             
-            # Вставляем в vector store
-            if points:
+            if hasattr(self.vector_store, 'upsert'):
+                # Готовим точки для вставки в vector store: вектор - строка
+                # float32 матрицы, без списка питоновских float
+                points = [
+                    {'id': payload['id'], 'vector': vector, 'payload': payload}
+                    for payload, vector in zip(payloads, matrix)
+                ]
                 await self._upsert_points(collection_name, points)
-                indexed += len(points)
+            else:
+                # Redis без RediSearch - для _brute_force_vector_search
+                await self._write_vectors(collection_name, payloads, matrix)
+            
+            indexed += len(payloads)
         
         return indexed
     
@@ -446,14 +755,40 @@ class VectorIndexer:
             try:
                 await self.vector_store.create_collection(
                     collection_name=collection_name,
-                    vectors_config={
-                        'size': self.embedding_service.model.dimension,
-                        'distance': 'Cosine'
-                    }
+                    dimension=self.embedding_service.model.dimension,
+                    distance='cosine'
                 )
             except Exception:
                 pass  # Коллекция уже существует
     
+    async def _write_vectors(
+        self,
+        collection_name: str,
+        payloads: List[Dict[str, Any]],
+        matrix: np.ndarray
+    ):
+        """
+        Запись точек в hash-и {collection}:{id} в формате RedisVectorStore
+        одним pipeline
+        
+        Вектор хранится в int8 с масштабом (как кэш embeddings) в поле
+        embedding_i8 - вчетверо меньше float32 в Redis и при загрузке;
+        поле embedding оставлено float32 индексам RediSearch.
+        None (товар без бренда, категории или цены) Redis не принимает -
+        пишется пустая строка, для цены 0.
+        """
+        pipe = self.vector_store.pipeline(transaction=False)
+        for payload, quantized in zip(payloads, _quantize_embeddings(matrix)):
+            mapping = {k: '' if v is None else v for k, v in payload.items()}
+            pipe.hset(f"{collection_name}:{payload['id']}", mapping={
+                **mapping,
+                'price': 0 if payload['price'] is None else payload['price'],
+                'in_stock': 'true' if payload['in_stock'] else 'false',
+                'embedding_i8': quantized,
+            })
+            pipe.hdel(f"{collection_name}:{payload['id']}", 'embedding')
+        await pipe.execute()
+    
     async def _upsert_points(self, collection_name: str, points: List[Dict]):
         """Вставка/обновление точек"""
         if hasattr(self.vector_store, 'upsert'):
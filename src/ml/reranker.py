@@ -9,11 +9,16 @@ Cross-encoder оценивает релевантность пары (query, doc
 - BAAI/bge-reranker-base (мультиязычная)
 - jeffwan/mmarco-mMiniLMv2-L12-H384-v1 (мультиязычная)
 """
+import asyncio
+import hashlib
+import logging
 import numpy as np
 from typing import List, Tuple, Optional, Dict, Any
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class RerankerConfig:
@@ -21,8 +26,10 @@ class RerankerConfig:
     model_name: str = "BAAI/bge-reranker-base"
     max_length: int = 512
     batch_size: int = 32
+    max_batch_tokens: int = 4096  # Бюджет батча: пар * длина самой длинной пары
     device: str = "cpu"
     top_k: int = 20  # Сколько результатов переранжировать
+    onnx_path: Optional[str] = None  # Экспортированная ONNX модель для OnnxCrossEncoderReranker
 
 
 class NeuralReranker(ABC):
@@ -57,9 +64,25 @@ class CrossEncoderReranker(NeuralReranker):
     Более точный, но медленнее чем bi-encoder.
     """
     
-    def __init__(self, config: RerankerConfig):
+    def __init__(self, config: RerankerConfig, warmup: bool = True):
         self.config = config
         self._model = None
+        
+        if warmup:
+            self.warmup()
+    
+    def warmup(self):
+        """
+        Загрузка модели и пробный прогон
+        
+        Первый вызов модели компилирует/выбирает ядра (oneDNN, cuDNN, MLAS) -
+        без прогрева это добавляет сотни мс к первому запросу пользователя.
+        Короткая и длинная (max_length) пары прогоняют обе крайние формы.
+        """
+        self.score_pairs([
+            ("warmup", "warmup"),
+            ("warmup", "warmup " * self.config.max_length),
+        ])
     
     def _load_model(self):
         """Ленивая загрузка модели"""
@@ -91,26 +114,60 @@ class CrossEncoderReranker(NeuralReranker):
         if not documents:
             return []
         
+        top_k = top_k or self.config.top_k
+        
+        # Формируем пары (query, document) и получаем scores
+        scores = self.score_pairs([(query, doc) for doc in documents])
+        
+        return _top_k_scores(scores, top_k)
+    
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """
+        Scores релевантности для пар (query, document) в исходном порядке
+        
+        Пары могут относиться к разным запросам - так их объединяет
+        RerankBatcher. Модель паддит батч до самой длинной пары, а
+        стоимость cross-encoder растёт с длиной, поэтому пары сортируются
+        по длине и режутся на батчи в пределах max_batch_tokens: редкие
+        длинные описания не раздувают батчи коротких названий.
+        """
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
+        
         self._load_model()
         
-        top_k = top_k or self.config.top_k
+        lengths = [self._estimate_tokens(query, document) for query, document in pairs]
+        order = np.argsort(lengths, kind='stable')
         
-        # Формируем пары (query, document)
-        pairs = [(query, doc) for doc in documents]
+        scores = np.empty(len(pairs), dtype=np.float32)
+        start = 0
+        while start < len(order):
+            # Длины растут - последняя пара батча самая длинная
+            end = start + 1
+            while (
+                end < len(order)
+                and end - start < self.config.batch_size
+                and (end - start + 1) * lengths[order[end]] <= self.config.max_batch_tokens
+            ):
+                end += 1
+            
+            batch = order[start:end]
+            scores[batch] = self._predict_batch([pairs[i] for i in batch])
+            start = end
         
-        # Получаем scores
-        scores = self._model.predict(
+        return scores
+    
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Scores одного батча пар"""
+        return self._model.predict(
             pairs,
-            batch_size=self.config.batch_size,
+            batch_size=len(pairs),
             show_progress_bar=False
         )
-        
-        # Создаём список (index, score) и сортируем
-        indexed_scores = list(enumerate(scores))
-        indexed_scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # Возвращаем top_k
-        return indexed_scores[:top_k]
+    
+    def _estimate_tokens(self, query: str, document: str) -> int:
+        """Грубая оценка длины пары в токенах (~4 символа на токен)"""
+        return min((len(query) + len(document)) // 4 + 1, self.config.max_length)
     
     def rerank_products(
         self,
@@ -135,22 +192,12 @@ class CrossEncoderReranker(NeuralReranker):
             return []
         
         # Извлекаем тексты
-        documents = []
-        for product in products:
-            text = self._get_product_text(product, text_field)
-            documents.append(text)
+        documents = [self._get_product_text(product, text_field) for product in products]
         
         # Переранжируем
         reranked = self.rerank(query, documents, top_k)
         
-        # Возвращаем товары в новом порядке
-        result = []
-        for original_idx, score in reranked:
-            product = products[original_idx].copy()
-            product["rerank_score"] = float(score)
-            result.append(product)
-        
-        return result
+        return _reranked_products(products, reranked)
     
     def _get_product_text(self, product: Dict, text_field: str) -> str:
         """Извлечение текста для ранжирования"""
@@ -175,6 +222,303 @@ class CrossEncoderReranker(NeuralReranker):
         return " | ".join(parts)
 
 
+class OnnxCrossEncoderReranker(CrossEncoderReranker):
+    """
+    Cross-encoder на ONNX Runtime (CPU)
+    
+    Та же модель, экспортированная в ONNX; с int8 весами (см. quantize)
+    читает вчетверо меньше памяти на токен и считает int8 умножения
+    через VNNI - в 3-4 раза быстрее FP32 PyTorch на CPU.
+    Пары токенизируются библиотекой tokenizers с паддингом до самой
+    длинной пары батча, а не до max_length.
+    """
+    
+    def __init__(self, config: RerankerConfig, warmup: bool = True):
+        if not config.onnx_path:
+            raise ValueError("RerankerConfig.onnx_path is required for OnnxCrossEncoderReranker")
+        
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        super().__init__(config, warmup)
+    
+    def _load_model(self):
+        """Ленивая загрузка сессии и токенизатора"""
+        if self._session is None:
+            try:
+                import onnxruntime
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise ImportError(
+                    "onnxruntime/tokenizers not installed. "
+                    "Run: pip install onnxruntime tokenizers"
+                )
+            
+            self._tokenizer = Tokenizer.from_pretrained(self.config.model_name)
+            self._tokenizer.enable_truncation(max_length=self.config.max_length)
+            self._tokenizer.enable_padding()
+            
+            self._session = onnxruntime.InferenceSession(
+                self.config.onnx_path,
+                providers=["CPUExecutionProvider"]
+            )
+            self._input_names = tuple(i.name for i in self._session.get_inputs())
+    
+    @staticmethod
+    def quantize(model_path: str, output_path: str) -> None:
+        """
+        Динамическая int8 квантизация весов экспортированной ONNX модели
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(pairs)
+        
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self._session.run(
+            None,
+            {name: feed[name] for name in self._input_names}
+        )[0]
+        
+        # Одна логита релевантности -> sigmoid, как у CrossEncoder
+        logits = logits.reshape(len(encodings), -1)[:, 0].astype(np.float32)
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+class CudaCrossEncoderReranker(CrossEncoderReranker):
+    """
+    Cross-encoder на GPU: bf16 веса и FlashAttention-2
+    
+    FlashAttention сливает softmax с умножениями и не пишет в память
+    матрицу внимания S x S - те же FLOPs при в 2-4 раза меньшем трафике.
+    Модель грузится напрямую через transformers (CrossEncoder не даёт
+    выбрать реализацию внимания); без пакета flash-attn используется
+    SDPA из PyTorch.
+    """
+    
+    def __init__(self, config: RerankerConfig, warmup: bool = True):
+        self._tokenizer = None
+        super().__init__(config, warmup)
+    
+    def _load_model(self):
+        """Ленивая загрузка модели и токенизатора"""
+        if self._model is None:
+            try:
+                import torch
+                from transformers import AutoModelForSequenceClassification, AutoTokenizer
+            except ImportError:
+                raise ImportError(
+                    "transformers not installed. "
+                    "Run: pip install transformers"
+                )
+            
+            self._tokenizer = AutoTokenizer.from_pretrained(self.config.model_name)
+            try:
+                model = AutoModelForSequenceClassification.from_pretrained(
+                    self.config.model_name,
+                    torch_dtype=torch.bfloat16,
+                    attn_implementation="flash_attention_2"
+                )
+            except (ImportError, ValueError):
+                # flash-attn не установлен или модель его не поддерживает
+                model = AutoModelForSequenceClassification.from_pretrained(
+                    self.config.model_name,
+                    torch_dtype=torch.bfloat16,
+                    attn_implementation="sdpa"
+                )
+            
+            self._model = model.to(self.config.device).eval()
+    
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        import torch
+        
+        inputs = self._tokenizer(
+            [query for query, _ in pairs],
+            [document for _, document in pairs],
+            padding="longest",
+            truncation=True,
+            max_length=self.config.max_length,
+            return_tensors="pt"
+        ).to(self.config.device)
+        
+        with torch.inference_mode():
+            logits = self._model(**inputs).logits
+        
+        # Одна логита релевантности -> sigmoid, как у CrossEncoder
+        return torch.sigmoid(logits[:, 0]).float().cpu().numpy()
+
+
+def _top_k_scores(scores, top_k: int) -> List[Tuple[int, float]]:
+    """(index, score) по убыванию score, первые top_k"""
+    indexed_scores = list(enumerate(scores))
+    indexed_scores.sort(key=lambda x: x[1], reverse=True)
+    return indexed_scores[:top_k]
+
+
+def _reranked_products(
+    products: List[Dict[str, Any]],
+    reranked: List[Tuple[int, float]]
+) -> List[Dict[str, Any]]:
+    """Товары в порядке re-ranker с добавленным rerank_score"""
+    result = []
+    for original_idx, score in reranked:
+        product = products[original_idx].copy()
+        product["rerank_score"] = float(score)
+        result.append(product)
+    return result
+
+
+class RerankBatcher:
+    """
+    Динамический батчинг cross-encoder между параллельными запросами
+    
+    Каждый rerank() кладёт свои пары в очередь; фоновая задача ждёт до
+    max_wait_ms (или пока не наберётся max_tokens) и отправляет всё
+    накопленное в модель одним score_pairs в отдельном потоке, затем
+    раздаёт scores по запросам. Вместо отдельного маленького батча на
+    каждый запрос модель получает один крупный - меньше накладных
+    расходов на вызов и event loop не блокируется на инференсе.
+    
+    С redis_client scores кэшируются: популярный запрос приходит от многих
+    пользователей с теми же товарами, и модель считает только новые пары.
+    Ключи:
+    - rerank:{model}:{query_hash} - HASH {document_hash: score}, TTL cache_ttl
+    """
+    
+    def __init__(
+        self,
+        reranker: CrossEncoderReranker,
+        max_wait_ms: float = 5.0,
+        max_tokens: int = 8192,
+        redis_client=None,
+        cache_ttl: int = 86400
+    ):
+        self.reranker = reranker
+        self.max_wait = max_wait_ms / 1000
+        self.max_tokens = max_tokens
+        self.redis = redis_client
+        self.cache_ttl = cache_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+    
+    async def rerank(
+        self,
+        query: str,
+        documents: List[str],
+        top_k: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """То же, что NeuralReranker.rerank, но через общий батч"""
+        if not documents:
+            return []
+        
+        scores = np.empty(len(documents), dtype=np.float32)
+        missing = list(range(len(documents)))
+        
+        if self.redis:
+            cache_key = f"rerank:{self.reranker.config.model_name}:{self._text_hash(query)}"
+            fields = [self._text_hash(doc) for doc in documents]
+            try:
+                cached = await self.redis.hmget(cache_key, fields)
+            except Exception as e:
+                # Недоступный кэш - не повод ронять поиск, считаем всё заново
+                logger.warning("[RerankBatcher] cache read failed: %s", e)
+                cached = [None] * len(documents)
+            missing = [i for i, value in enumerate(cached) if value is None]
+            for i, value in enumerate(cached):
+                if value is not None:
+                    scores[i] = float(value)
+        
+        if missing:
+            computed = await self._score([(query, documents[i]) for i in missing])
+            scores[missing] = computed
+            
+            if self.redis:
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    pipe.hset(cache_key, mapping={
+                        fields[i]: str(float(score)) for i, score in zip(missing, computed)
+                    })
+                    pipe.expire(cache_key, self.cache_ttl)
+                    await pipe.execute()
+                except Exception as e:
+                    logger.warning("[RerankBatcher] cache write failed: %s", e)
+        
+        return _top_k_scores(scores, top_k or self.reranker.config.top_k)
+    
+    async def _score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Scores пар через общий батч фоновой задачи"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((pairs, future))
+        return await future
+    
+    async def rerank_products(
+        self,
+        query: str,
+        products: List[Dict[str, Any]],
+        text_field: str = "name",
+        top_k: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """То же, что CrossEncoderReranker.rerank_products, но через общий батч"""
+        if not products:
+            return []
+        
+        documents = [self.reranker._get_product_text(product, text_field) for product in products]
+        reranked = await self.rerank(query, documents, top_k)
+        
+        return _reranked_products(products, reranked)
+    
+    async def _run(self):
+        """Фоновая задача: собирает запросы в батч и отправляет в модель"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._queue.get()]
+            tokens = sum(self.reranker._estimate_tokens(q, d) for q, d in batch[0][0])
+            deadline = loop.time() + self.max_wait
+            
+            # Добираем запросы, пока не истекло окно или не набран бюджет
+            while tokens < self.max_tokens:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                tokens += sum(self.reranker._estimate_tokens(q, d) for q, d in item[0])
+            
+            pairs = [pair for item_pairs, _ in batch for pair in item_pairs]
+            try:
+                scores = await asyncio.to_thread(self.reranker.score_pairs, pairs)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            # Раздаём scores по запросам в порядке постановки
+            offset = 0
+            for item_pairs, future in batch:
+                if not future.done():
+                    future.set_result(scores[offset:offset + len(item_pairs)])
+                offset += len(item_pairs)
+
+
 class MockReranker(NeuralReranker):
     """
     Mock re-ranker для тестирования
@@ -206,7 +550,9 @@ class MockReranker(NeuralReranker):
 def create_reranker(
     model_name: str = "auto",
     device: str = "cpu",
-    use_mock: bool = False
+    use_mock: bool = False,
+    onnx_path: Optional[str] = None,
+    warmup: bool = True
 ) -> NeuralReranker:
     """
     Фабрика для создания re-ranker
@@ -215,6 +561,11 @@ def create_reranker(
         model_name: Название модели или "auto"
         device: Устройство (cpu, cuda)
         use_mock: Использовать mock (для тестов)
+        onnx_path: Путь к ONNX экспорту модели - на CPU используется
+            OnnxCrossEncoderReranker
+        warmup: Загрузить и прогреть модель сразу, а не на первом запросе
+    
+    На cuda используется CudaCrossEncoderReranker (bf16 + FlashAttention-2).
     """
     if use_mock:
         return MockReranker()
@@ -224,7 +575,14 @@ def create_reranker(
     
     config = RerankerConfig(
         model_name=model_name,
-        device=device
+        device=device,
+        onnx_path=onnx_path
     )
     
-    return CrossEncoderReranker(config)
+    if onnx_path and device == "cpu":
+        return OnnxCrossEncoderReranker(config, warmup)
+    
+    if device.startswith("cuda"):
+        return CudaCrossEncoderReranker(config, warmup)
+    
+    return CrossEncoderReranker(config, warmup)
@@ -7,11 +7,32 @@ Spell Checker - исправление опечаток в поисковых з
 3. Neural - нейросетевой подход (T5, BERT)
 """
 import re
-from typing import List, Dict, Set, Optional, Tuple
+import threading
+from array import array
+from functools import partial
+from typing import List, Dict, Set, Optional, Tuple, Callable
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 import hashlib
 
+try:
+    from rapidfuzz import process as _rf_process
+    from rapidfuzz.distance import Levenshtein as _Levenshtein
+except ImportError:  # опциональная зависимость - без неё расстояние считается на Python
+    _rf_process = None
+    _Levenshtein = None
+
+
+# Всё кроме букв, цифр, "_" и пробельных символов - заменяется пробелом
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+# То же для ASCII текста: bytes.translate - побайтовая таблица без regex движка
+_ASCII_PUNCT_TABLE = bytes(
+    code if code >= 128 or chr(code).isalnum() or chr(code).isspace() or chr(code) == '_'
+    else ord(' ')
+    for code in range(256)
+)
+
 
 @dataclass
 class SpellCheckResult:
@@ -23,32 +44,143 @@ class SpellCheckResult:
     was_corrected: bool
 
 
+class BKTree:
+    """
+    BK-дерево по метрике (расстояние Левенштейна)
+    
+    Потомки узла сгруппированы по расстоянию до него. По неравенству
+    треугольника при поиске в радиусе k из узла на расстоянии d обходятся
+    только потомки с ключами d - k..d + k. В отличие от SymSpell хранится
+    одна запись на слово - без сотен deletes, поэтому подходит для больших
+    словарей.
+    """
+    
+    def __init__(self, distance: Callable[[str, str], int]):
+        self._distance = distance
+        # Узел: (слово, {расстояние: дочерний узел})
+        self._root: Optional[Tuple[str, Dict[int, tuple]]] = None
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def add(self, word: str):
+        """Добавление слова (повторное добавление игнорируется)"""
+        if self._root is None:
+            self._root = (word, {})
+            self._size = 1
+            return
+        
+        node_word, children = self._root
+        while True:
+            distance = self._distance(word, node_word)
+            if distance == 0:
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (word, {})
+                self._size += 1
+                return
+            node_word, children = child
+    
+    def find(self, word: str, max_distance: int) -> List[Tuple[str, int]]:
+        """
+        Поиск слов в радиусе max_distance
+        
+        Returns:
+            [(word, distance), ...]
+        """
+        if self._root is None:
+            return []
+        
+        found = []
+        stack = [self._root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = self._distance(word, node_word)
+            if distance <= max_distance:
+                found.append((node_word, distance))
+            
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        
+        return found
+    
+    def clear(self):
+        self._root = None
+        self._size = 0
+
+
 class SpellChecker:
     """
     Проверка и исправление опечаток
     
     Использует комбинацию методов:
     1. Словарь известных слов (из индекса товаров)
-    2. SymSpell для быстрого поиска кандидатов
+    2. SymSpell (или BK-дерево для больших словарей) для быстрого поиска кандидатов
     3. Контекстное ранжирование
+    
+    Индекс кандидатов (index_type):
+    - "symspell" - быстрый поиск, но O(len^d) deletes на слово в памяти
+    - "bk" - BK-дерево: одна запись на слово, поиск медленнее
+    - "auto" - BK-дерево, если в словаре больше BK_TREE_MIN_WORDS слов
+      и установлен rapidfuzz (на Python-расстоянии дерево слишком медленное)
     """
     
+    # Размеры LRU кэшей исправлений (запросов и отдельных слов)
+    CACHE_SIZE = 50_000
+    WORD_CACHE_SIZE = 50_000
+    
+    # С какого размера словаря "auto" выбирает BK-дерево
+    BK_TREE_MIN_WORDS = 100_000
+    
+    INDEX_TYPES = ("auto", "symspell", "bk")
+    
     def __init__(
         self,
         max_edit_distance: int = 2,
         min_word_length: int = 3,
-        dictionary: Optional[Set[str]] = None
+        dictionary: Optional[Set[str]] = None,
+        index_type: str = "auto",
+        prefix_length: Optional[int] = 7
     ):
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown index_type: {index_type}")
+        
         self.max_edit_distance = max_edit_distance
         self.min_word_length = min_word_length
         self.dictionary = dictionary or set()
         self.word_frequencies = defaultdict(int)
+        self.index_type = index_type
+        # SymSpell индексирует только первые prefix_length символов слова:
+        # deletes длинных слов почти не добавляют кандидатов, а память
+        # растёт как O(len^d). None - индексировать слово целиком
+        self.prefix_length = prefix_length
+        
+        # BK-дерево - вместо SymSpell индекса, если выбрано
+        self._bk_tree: Optional[BKTree] = (
+            BKTree(self._levenshtein_distance) if index_type == "bk" else None
+        )
+        
+        # Слова SymSpell индекса: id -> слово и слово -> id
+        self._words: List[str] = []
+        self._word_ids: Dict[str, int] = {}
+        
+        # SymSpell индекс (слово с удалёнными символами -> id оригиналов).
+        # array('I') - 4 байта на id вместо set из ссылок на строки
+        self._symspell_index: Dict[str, array] = defaultdict(partial(array, "I"))
+        
+        # LRU кэш исправлений запросов
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
         
-        # SymSpell индекс (слово с удалёнными символами -> оригиналы)
-        self._symspell_index: Dict[str, Set[str]] = defaultdict(set)
+        # LRU кэш исправлений слов: общие слова разных запросов
+        # не ищутся через SymSpell повторно
+        self._word_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
         
-        # Кэш исправлений
-        self._cache: Dict[str, str] = {}
+        # check() вызывается из пула потоков (asyncio.to_thread) - доступ
+        # к LRU кэшам только под блокировкой
+        self._cache_lock = threading.Lock()
     
     def build_dictionary(self, texts: List[str]):
         """
@@ -64,8 +196,8 @@ class SpellChecker:
                     self.dictionary.add(word)
                     self.word_frequencies[word] += 1
         
-        # Строим SymSpell индекс
-        self._build_symspell_index()
+        # Строим индекс кандидатов
+        self._build_index()
     
     def add_words(self, words: List[str]):
         """Добавление слов в словарь"""
@@ -74,7 +206,13 @@ class SpellChecker:
             if len(word) >= self.min_word_length:
                 self.dictionary.add(word)
                 self.word_frequencies[word] += 1
-                self._add_to_symspell(word)
+                if self._bk_tree is not None:
+                    self._bk_tree.add(word)
+                else:
+                    self._add_to_symspell(word)
+        
+        # Исправления, найденные по старому словарю, могли устареть
+        self._clear_caches()
     
     def check(self, query: str) -> SpellCheckResult:
         """
@@ -88,8 +226,8 @@ class SpellChecker:
         """
         # Проверяем кэш
         cache_key = query.lower()
-        if cache_key in self._cache:
-            corrected = self._cache[cache_key]
+        corrected = self._cache_get(self._cache, cache_key)
+        if corrected is not None:
             return SpellCheckResult(
                 original=query,
                 corrected=corrected,
@@ -110,7 +248,15 @@ class SpellChecker:
                 total_confidence += 1.0
             else:
                 # Ищем исправление
-                correction, confidence = self._find_correction(word)
+                cached = self._cache_get(self._word_cache, word)
+                if cached is not None:
+                    correction, confidence = cached
+                else:
+                    correction, confidence = self._find_correction(word)
+                    self._cache_put(
+                        self._word_cache, word, (correction, confidence), self.WORD_CACHE_SIZE
+                    )
+                
                 corrected_words.append(correction)
                 total_confidence += confidence
                 
@@ -121,7 +267,7 @@ class SpellChecker:
         avg_confidence = total_confidence / len(words) if words else 1.0
         
         # Сохраняем в кэш
-        self._cache[cache_key] = corrected
+        self._cache_put(self._cache, cache_key, corrected, self.CACHE_SIZE)
         
         return SpellCheckResult(
             original=query,
@@ -131,13 +277,61 @@ class SpellChecker:
             was_corrected=len(corrections) > 0
         )
     
+    def _cache_get(self, cache: OrderedDict, key: str):
+        """Значение из LRU кэша (None - нет) с обновлением порядка"""
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache: OrderedDict, key: str, value, max_size: int):
+        """Запись в LRU кэш с вытеснением самых старых записей"""
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+    
+    def _clear_caches(self):
+        """Сброс кэшей исправлений"""
+        with self._cache_lock:
+            self._cache.clear()
+            self._word_cache.clear()
+    
     def _tokenize(self, text: str) -> List[str]:
         """Токенизация текста"""
         text = text.lower()
         # Удаляем всё кроме букв, цифр, пробелов
-        text = re.sub(r'[^\w\s]', ' ', text)
+        if text.isascii():
+            text = text.encode('ascii').translate(_ASCII_PUNCT_TABLE).decode('ascii')
+        else:
+            text = _PUNCT_RE.sub(' ', text)
         return text.split()
     
+    def _build_index(self):
+        """Построение индекса кандидатов выбранного типа"""
+        use_bk_tree = self.index_type == "bk" or (
+            self.index_type == "auto"
+            and _Levenshtein is not None
+            and len(self.dictionary) > self.BK_TREE_MIN_WORDS
+        )
+        
+        if not use_bk_tree:
+            self._bk_tree = None
+            self._build_symspell_index()
+            return
+        
+        # SymSpell индекс не нужен - освобождаем память
+        self._symspell_index.clear()
+        self._words.clear()
+        self._word_ids.clear()
+        self._clear_caches()
+        
+        self._bk_tree = BKTree(self._levenshtein_distance)
+        for word in self.dictionary:
+            self._bk_tree.add(word)
+    
     def _build_symspell_index(self):
         """
         Построение SymSpell индекса
@@ -146,36 +340,51 @@ class SpellChecker:
         и сохраняем маппинг delete -> originals
         """
         self._symspell_index.clear()
+        self._clear_caches()
+        self._words.clear()
+        self._word_ids.clear()
         
         for word in self.dictionary:
             self._add_to_symspell(word)
     
     def _add_to_symspell(self, word: str):
         """Добавление слова в SymSpell индекс"""
-        # Само слово
-        self._symspell_index[word].add(word)
+        if word in self._word_ids:
+            return
+        
+        word_id = len(self._words)
+        self._words.append(word)
+        self._word_ids[word] = word_id
+        
+        # Само слово (его префикс)
+        key = word[:self.prefix_length] if self.prefix_length else word
+        self._symspell_index[key].append(word_id)
         
         # Генерируем deletes
-        deletes = self._generate_deletes(word, self.max_edit_distance)
+        deletes = self._generate_deletes(key, self.max_edit_distance)
         for delete in deletes:
-            self._symspell_index[delete].add(word)
+            self._symspell_index[delete].append(word_id)
     
     def _generate_deletes(self, word: str, max_distance: int) -> Set[str]:
         """
         Генерация всех вариантов слова с удалёнными символами
+        
+        Обход в ширину по уровням: варианты с d удалениями получаются только
+        из новых вариантов с d - 1, каждый вариант разворачивается один раз.
         """
         deletes = set()
+        frontier = {word}
+        
+        for _ in range(max_distance):
+            next_frontier = set()
+            for variant in frontier:
+                for i in range(len(variant)):
+                    next_frontier.add(variant[:i] + variant[i+1:])
+            next_frontier -= deletes
+            next_frontier.discard("")
+            deletes |= next_frontier
+            frontier = next_frontier
         
-        def _recurse(word: str, distance: int):
-            if distance == 0:
-                return
-            for i in range(len(word)):
-                delete = word[:i] + word[i+1:]
-                if delete and delete not in deletes:
-                    deletes.add(delete)
-                    _recurse(delete, distance - 1)
-        
-        _recurse(word, max_distance)
         return deletes
     
     def _find_correction(self, word: str) -> Tuple[str, float]:
@@ -190,71 +399,156 @@ class SpellChecker:
         if not candidates:
             return word, 0.5  # Низкая уверенность, оставляем как есть
         
-        # Ранжируем кандидатов
-        scored = []
-        for candidate in candidates:
-            distance = self._levenshtein_distance(word, candidate)
-            frequency = self.word_frequencies.get(candidate, 1)
-            
-            # Score: меньше расстояние + больше частота = лучше
-            score = frequency / (distance + 1)
-            scored.append((candidate, distance, score))
+        # Ранжируем кандидатов (расстояния уже посчитаны при отборе):
+        # нужен только лучший - один проход вместо сортировки всего списка
+        frequencies = self.word_frequencies
+        best_candidate, distance = candidates[0]
+        best_score = frequencies.get(best_candidate, 1) / (distance + 1)
         
-        # Сортируем по score desc
-        scored.sort(key=lambda x: x[2], reverse=True)
-        
-        best_candidate, distance, _ = scored[0]
+        for candidate, candidate_distance in candidates[1:]:
+            # Score: меньше расстояние + больше частота = лучше
+            score = frequencies.get(candidate, 1) / (candidate_distance + 1)
+            if score > best_score:
+                best_candidate, distance, best_score = candidate, candidate_distance, score
         
         # Confidence зависит от расстояния
         confidence = 1.0 - (distance / (self.max_edit_distance + 1))
         
         return best_candidate, confidence
     
-    def _get_candidates(self, word: str) -> Set[str]:
+    def _get_candidates(self, word: str) -> List[Tuple[str, int]]:
         """
         Получение кандидатов для исправления через SymSpell
+        
+        Returns:
+            [(candidate, distance), ...] - кандидаты в пределах max_edit_distance
         """
-        candidates = set()
+        if self._bk_tree is not None:
+            return self._bk_tree.find(word, self.max_edit_distance)
+        
+        index = self._symspell_index
+        hits = []
         
-        # Проверяем само слово
-        if word in self._symspell_index:
-            candidates.update(self._symspell_index[word])
+        # Проверяем само слово (его префикс)
+        key = word[:self.prefix_length] if self.prefix_length else word
+        if key in index:
+            hits.append(index[key])
         
         # Проверяем deletes от входного слова
-        deletes = self._generate_deletes(word, self.max_edit_distance)
+        deletes = self._generate_deletes(key, self.max_edit_distance)
         for delete in deletes:
-            if delete in self._symspell_index:
-                candidates.update(self._symspell_index[delete])
+            if delete in index:
+                hits.append(index[delete])
         
-        # Фильтруем по расстоянию
-        valid_candidates = set()
-        for candidate in candidates:
-            distance = self._levenshtein_distance(word, candidate)
-            if distance <= self.max_edit_distance:
-                valid_candidates.add(candidate)
+        if not hits:
+            return []
+        
+        # Объединяем id (хеш int дешевле хеша строки), строки - только для итога
+        ids = set().union(*hits)
+        words = self._words
+        candidates = [words[i] for i in ids]
         
-        return valid_candidates
+        # Фильтруем по расстоянию
+        if _rf_process is not None:
+            # Все расстояния одним вызовом в C++ вместо вызова на кандидата
+            distances = _rf_process.cdist(
+                [word],
+                candidates,
+                scorer=_Levenshtein.distance,
+                score_cutoff=self.max_edit_distance
+            )[0].tolist()
+        else:
+            distances = [
+                self._levenshtein_distance(word, candidate, self.max_edit_distance)
+                for candidate in candidates
+            ]
+        
+        return [
+            (candidate, distance)
+            for candidate, distance in zip(candidates, distances)
+            if distance <= self.max_edit_distance
+        ]
     
-    def _levenshtein_distance(self, s1: str, s2: str) -> int:
-        """Расстояние Левенштейна"""
+    def _levenshtein_distance(
+        self,
+        s1: str,
+        s2: str,
+        max_distance: Optional[int] = None
+    ) -> int:
+        """
+        Расстояние Левенштейна
+        
+        С rapidfuzz считается в C++ (bit-parallel), иначе - DP на Python.
+        
+        Args:
+            max_distance: Порог - если расстояние его превышает, расчёт
+                прерывается и возвращается max_distance + 1
+        """
+        if _Levenshtein is not None:
+            return _Levenshtein.distance(s1, s2, score_cutoff=max_distance)
+        
+        # Общие префикс и суффикс на расстояние не влияют - отрезаем,
+        # у опечатки обычно остаётся короткая середина
+        prefix = 0
+        shortest = min(len(s1), len(s2))
+        while prefix < shortest and s1[prefix] == s2[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < shortest - prefix and s1[-1 - suffix] == s2[-1 - suffix]:
+            suffix += 1
+        s1 = s1[prefix:len(s1) - suffix]
+        s2 = s2[prefix:len(s2) - suffix]
+        
         if len(s1) < len(s2):
             s1, s2 = s2, s1
         
+        # Расстояние не меньше разницы длин (в т.ч. для пустой s2)
+        if max_distance is not None and len(s1) - len(s2) > max_distance:
+            return max_distance + 1
+        
         if len(s2) == 0:
             return len(s1)
         
-        previous_row = range(len(s2) + 1)
-        
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
+        if max_distance is None:
+            band = len(s1)
+            limit = len(s1)
+        else:
+            # Ячейки дальше max_distance от диагонали заведомо больше порога -
+            # считаем только полосу шириной 2 * max_distance + 1
+            band = max_distance
+            limit = max_distance + 1
+        
+        len2 = len(s2)
+        previous_row = [j if j <= band else limit for j in range(len2 + 1)]
+        
+        for i, c1 in enumerate(s1, 1):
+            lo = max(1, i - band)
+            hi = min(len2, i + band)
+            current_row = [limit] * (len2 + 1)
+            current_row[0] = i if i <= band else limit
+            row_min = current_row[0]
+            
+            for j in range(lo, hi + 1):
+                distance = min(
+                    previous_row[j] + 1,
+                    current_row[j - 1] + 1,
+                    previous_row[j - 1] + (c1 != s2[j - 1])
+                )
+                if distance > limit:
+                    distance = limit
+                current_row[j] = distance
+                if distance < row_min:
+                    row_min = distance
+            
+            # Минимум строки не убывает - дальше порог уже не достичь
+            if max_distance is not None and row_min > max_distance:
+                return max_distance + 1
             previous_row = current_row
         
-        return previous_row[-1]
+        distance = previous_row[-1]
+        if max_distance is not None and distance > max_distance:
+            return max_distance + 1
+        return distance
 
 
 class TransliterationChecker:
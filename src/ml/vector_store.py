@@ -68,12 +68,31 @@ class QdrantVectorStore(VectorStore):
     Клиент для Qdrant
     
     Требует: pip install qdrant-client
+    
+    С int8_quantization коллекции создаются со скалярной int8 квантизацией:
+    поиск идёт по int8 копии векторов в RAM (вчетверо меньше памяти
+    и трафика), оригиналы float32 остаются для пересчёта топа.
+    
+    С prefer_grpc клиент работает по gRPC: векторы уходят упакованными
+    float, а не JSON-текстом.
     """
     
-    def __init__(self, host: str = "localhost", port: int = 6333, api_key: Optional[str] = None):
+    # Точек в одном запросе upsert
+    UPSERT_BATCH_SIZE = 256
+    
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6333,
+        api_key: Optional[str] = None,
+        int8_quantization: bool = True,
+        prefer_grpc: bool = False
+    ):
         self.host = host
         self.port = port
         self.api_key = api_key
+        self.int8_quantization = int8_quantization
+        self.prefer_grpc = prefer_grpc
         self._client = None
     
     def _get_client(self):
@@ -86,7 +105,8 @@ class QdrantVectorStore(VectorStore):
                 self._client = QdrantClient(
                     host=self.host,
                     port=self.port,
-                    api_key=self.api_key
+                    api_key=self.api_key,
+                    prefer_grpc=self.prefer_grpc
                 )
                 self._models = models
             except ImportError:
@@ -110,12 +130,22 @@ class QdrantVectorStore(VectorStore):
             "dot": self._models.Distance.DOT,
         }
         
+        quantization_config = None
+        if self.int8_quantization:
+            quantization_config = self._models.ScalarQuantization(
+                scalar=self._models.ScalarQuantizationConfig(
+                    type=self._models.ScalarType.INT8,
+                    always_ram=True
+                )
+            )
+        
         client.create_collection(
             collection_name=collection_name,
             vectors_config=self._models.VectorParams(
                 size=dimension,
                 distance=distance_map.get(distance, self._models.Distance.COSINE)
-            )
+            ),
+            quantization_config=quantization_config
         )
     
     async def delete_collection(self, collection_name: str) -> None:
@@ -129,6 +159,19 @@ class QdrantVectorStore(VectorStore):
     ) -> int:
         client = self._get_client()
         
+        if points and all(isinstance(p["vector"], np.ndarray) for p in points):
+            # numpy векторы - одной матрицей: клиент сам режет её на
+            # батчи и не собирает список float на каждую точку
+            client.upload_collection(
+                collection_name=collection_name,
+                vectors=np.asarray([p["vector"] for p in points], dtype=np.float32),
+                payload=[p.get("payload", {}) for p in points],
+                ids=[p["id"] for p in points],
+                batch_size=self.UPSERT_BATCH_SIZE,
+                wait=True
+            )
+            return len(points)
+        
         qdrant_points = [
             self._models.PointStruct(
                 id=p["id"],
@@ -226,6 +269,9 @@ class RedisVectorStore(VectorStore):
     Требует: Redis Stack с модулем RediSearch
     """
     
+    # Точек в одном pipeline при upsert
+    UPSERT_BATCH_SIZE = 1000
+    
     def __init__(self, redis_client):
         self.redis = redis_client
     
@@ -282,25 +328,33 @@ class RedisVectorStore(VectorStore):
         collection_name: str,
         points: List[Dict[str, Any]]
     ) -> int:
+        if not points:
+            return 0
+        
         prefix = f"{collection_name}:"
         
-        for point in points:
-            key = f"{prefix}{point['id']}"
-            vector_bytes = np.array(point["vector"], dtype=np.float32).tobytes()
-            
-            payload = point.get("payload", {})
-            
-            await self.redis.hset(key, mapping={
-                "id": point["id"],
-                "name": payload.get("name", ""),
-                "price": payload.get("price", 0),
-                "in_stock": "true" if payload.get("in_stock", True) else "false",
-                "category": payload.get("category", ""),
-                "brand": payload.get("brand", ""),
-                "url": payload.get("url", ""),
-                "image": payload.get("image", ""),
-                "embedding": vector_bytes
-            })
+        # Все векторы одной float32 матрицей - одно приведение типа на батч
+        vectors = np.asarray([point["vector"] for point in points], dtype=np.float32)
+        
+        # HSET пачками через pipeline - один round-trip на пачку, а не на точку
+        for start in range(0, len(points), self.UPSERT_BATCH_SIZE):
+            end = start + self.UPSERT_BATCH_SIZE
+            pipe = self.redis.pipeline(transaction=False)
+            for point, vector in zip(points[start:end], vectors[start:end]):
+                payload = point.get("payload", {})
+                
+                pipe.hset(f"{prefix}{point['id']}", mapping={
+                    "id": point["id"],
+                    "name": payload.get("name", ""),
+                    "price": payload.get("price", 0),
+                    "in_stock": "true" if payload.get("in_stock", True) else "false",
+                    "category": payload.get("category", ""),
+                    "brand": payload.get("brand", ""),
+                    "url": payload.get("url", ""),
+                    "image": payload.get("image", ""),
+                    "embedding": vector.tobytes()
+                })
+            await pipe.execute()
         
         return len(points)
     
@@ -402,13 +456,263 @@ class RedisVectorStore(VectorStore):
         return len(ids)
 
 
+class _InMemoryCollection:
+    """
+    Коллекция InMemoryVectorStore
+    
+    Векторы лежат одной непрерывной матрицей (строка на точку),
+    нормализованные при вставке - поиск сводится к одному matmul.
+    Ёмкость растёт удвоением, удаление переносит последнюю строку
+    на место удалённой.
+    
+    dtype матрицы: float32, float16 (вдвое меньше памяти) или int8 со
+    scale на строку (вчетверо меньше). Сжатые матрицы при поиске
+    приводятся к float32 блоками по SCORE_BLOCK_ROWS строк.
+    
+    После enable_hnsw() векторы дублируются в HNSW индекс (hnswlib) для
+    приближённого поиска за O(log N). Метки HNSW постоянны для точки
+    (строки матрицы при удалении переезжают), удалённые метки помечаются
+    mark_deleted.
+    
+    Поля payload, по которым фильтруют, собираются в колонки (SoA) при
+    первом фильтре и кэшируются до изменения коллекции - фильтр считается
+    векторно по колонкам, без обхода словарей на каждый запрос.
+    """
+    
+    VECTOR_DTYPES = ("float32", "float16", "int8")
+    
+    # Строк в блоке при приведении сжатой матрицы к float32 (блок в кэше CPU)
+    SCORE_BLOCK_ROWS = 4096
+    
+    # Начальная ёмкость HNSW индекса (дальше растёт удвоением)
+    HNSW_INITIAL_CAPACITY = 1024
+    
+    def __init__(self, dimension: int, distance: str, vector_dtype: str = "float32"):
+        if vector_dtype not in self.VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {vector_dtype}")
+        
+        self.dimension = dimension
+        self.distance = distance
+        self.vector_dtype = vector_dtype
+        self.ids: List[str] = []
+        self.payloads: List[Dict] = []
+        self.index: Dict[str, int] = {}
+        self._matrix = np.empty((0, dimension), dtype=vector_dtype)
+        self._scales = np.empty(0, dtype=np.float32) if vector_dtype == "int8" else None
+        self._columns: Dict[tuple, np.ndarray] = {}
+        
+        self._hnsw = None
+        self._hnsw_ef = 0
+        self._labels: Dict[str, int] = {}
+        self._label_ids: Dict[int, str] = {}
+        self._next_label = 0
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    @property
+    def has_hnsw(self) -> bool:
+        return self._hnsw is not None
+    
+    def enable_hnsw(self, ef_search: int = 64, ef_construction: int = 200, m: int = 16):
+        """Создание HNSW индекса (до вставки точек)"""
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError(
+                "hnswlib not installed. "
+                "Run: pip install hnswlib"
+            )
+        
+        index = hnswlib.Index(space="cosine", dim=self.dimension)
+        index.init_index(
+            max_elements=self.HNSW_INITIAL_CAPACITY,
+            ef_construction=ef_construction,
+            M=m
+        )
+        index.set_ef(ef_search)
+        self._hnsw = index
+        self._hnsw_ef = ef_search
+    
+    def knn(self, query_vec: np.ndarray, limit: int) -> List[tuple]:
+        """Приближённый поиск по HNSW: [(row, score), ...] по убыванию score"""
+        k = min(limit, len(self.ids))
+        if k <= 0:
+            return []
+        
+        self._hnsw.set_ef(max(self._hnsw_ef, k))
+        labels, distances = self._hnsw.knn_query(query_vec, k=k)
+        
+        # Для space="cosine" hnswlib возвращает distance = 1 - cosine
+        return [
+            (self.index[self._label_ids[label]], 1.0 - distance)
+            for label, distance in zip(labels[0].tolist(), distances[0].tolist())
+        ]
+    
+    def score(self, query_vec: np.ndarray) -> np.ndarray:
+        """Cosine similarity запроса (нормализованного) со всеми точками"""
+        size = len(self.ids)
+        if self.vector_dtype == "float32":
+            return self._matrix[:size] @ query_vec
+        
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, self.SCORE_BLOCK_ROWS):
+            end = min(start + self.SCORE_BLOCK_ROWS, size)
+            block = self._matrix[start:end].astype(np.float32)
+            np.matmul(block, query_vec, out=scores[start:end])
+        
+        if self._scales is not None:
+            scores *= self._scales[:size]
+        return scores
+    
+    def column(self, key: str, default: Any = None) -> np.ndarray:
+        """Значения поля payload по всем точкам (по строкам матрицы)"""
+        column = self._columns.get((key, default))
+        if column is None:
+            values = [payload.get(key, default) for payload in self.payloads]
+            if all(type(value) in (int, float) for value in values):
+                column = np.asarray(values, dtype=np.float64)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+            self._columns[(key, default)] = column
+        return column
+    
+    def filter_mask(self, query_filter: Dict) -> np.ndarray:
+        """Маска точек, подходящих под фильтр (условия must через AND)"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        
+        for condition in query_filter.get("must", []):
+            key = condition.get("key")
+            
+            if "match" in condition:
+                mask &= self.column(key) == condition["match"]["value"]
+            
+            elif "range" in condition:
+                actual = self.column(key, 0)
+                if "gte" in condition["range"]:
+                    mask &= actual >= condition["range"]["gte"]
+                if "lte" in condition["range"]:
+                    mask &= actual <= condition["range"]["lte"]
+        
+        return mask
+    
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        self._columns.clear()
+        rows = []
+        for point_id, payload in zip(ids, payloads):
+            row = self.index.get(point_id)
+            if row is None:
+                row = len(self.ids)
+                self.index[point_id] = row
+                self.ids.append(point_id)
+                self.payloads.append(payload)
+            else:
+                self.payloads[row] = payload
+            rows.append(row)
+        
+        size = len(self.ids)
+        if size > len(self._matrix):
+            capacity = max(size, 2 * len(self._matrix))
+            matrix = np.empty((capacity, self.dimension), dtype=self._matrix.dtype)
+            matrix[:len(self._matrix)] = self._matrix
+            self._matrix = matrix
+            if self._scales is not None:
+                scales = np.empty(capacity, dtype=np.float32)
+                scales[:len(self._scales)] = self._scales
+                self._scales = scales
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        
+        if self._hnsw is not None:
+            self._hnsw_upsert(ids, vectors)
+        
+        if self._scales is not None:
+            # Симметричная квантизация: scale = max|x| / 127 на строку
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._scales[rows] = scales
+            vectors = np.rint(vectors / scales[:, None])
+        
+        self._matrix[rows] = vectors
+    
+    def _hnsw_upsert(self, ids: List[str], vectors: np.ndarray):
+        # Последний вектор для каждого id (id может повторяться в батче)
+        positions = {point_id: i for i, point_id in enumerate(ids)}
+        
+        labels = []
+        for point_id in positions:
+            label = self._labels.get(point_id)
+            if label is None:
+                label = self._next_label
+                self._next_label += 1
+                self._labels[point_id] = label
+                self._label_ids[label] = point_id
+            labels.append(label)
+        
+        # Удалённые (mark_deleted) элементы тоже занимают место в индексе
+        capacity = self._hnsw.get_max_elements()
+        if self._next_label > capacity:
+            self._hnsw.resize_index(max(self._next_label, 2 * capacity))
+        
+        self._hnsw.add_items(vectors[list(positions.values())], labels)
+    
+    def delete(self, point_id: str) -> bool:
+        row = self.index.pop(point_id, None)
+        if row is None:
+            return False
+        
+        if self._hnsw is not None:
+            label = self._labels.pop(point_id)
+            del self._label_ids[label]
+            self._hnsw.mark_deleted(label)
+        
+        self._columns.clear()
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.payloads[row] = self.payloads[last]
+            self._matrix[row] = self._matrix[last]
+            if self._scales is not None:
+                self._scales[row] = self._scales[last]
+            self.index[moved_id] = row
+        
+        self.ids.pop()
+        self.payloads.pop()
+        return True
+
+
 class InMemoryVectorStore(VectorStore):
     """
     In-memory vector store для тестирования и небольших коллекций
+    
+    vector_dtype - в каком виде хранить векторы: "float32", "float16"
+    или "int8" (см. _InMemoryCollection).
+    
+    С hnsw=True (требует: pip install hnswlib) коллекции дополнительно
+    строят HNSW индекс, и запросы без фильтра к коллекциям от
+    hnsw_min_points точек идут через него. На небольших коллекциях и
+    с фильтрами точный перебор матрицы быстрее и не теряет recall.
     """
     
-    def __init__(self):
-        self.collections: Dict[str, Dict[str, Dict]] = {}
+    def __init__(
+        self,
+        vector_dtype: str = "float32",
+        hnsw: bool = False,
+        hnsw_min_points: int = 5000,
+        hnsw_ef_search: int = 64
+    ):
+        if vector_dtype not in _InMemoryCollection.VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {vector_dtype}")
+        
+        self.vector_dtype = vector_dtype
+        self.hnsw = hnsw
+        self.hnsw_min_points = hnsw_min_points
+        self.hnsw_ef_search = hnsw_ef_search
+        self.collections: Dict[str, _InMemoryCollection] = {}
     
     async def create_collection(
         self,
@@ -417,11 +721,10 @@ class InMemoryVectorStore(VectorStore):
         distance: str = "cosine"
     ) -> None:
         if collection_name not in self.collections:
-            self.collections[collection_name] = {
-                "dimension": dimension,
-                "distance": distance,
-                "points": {}
-            }
+            collection = _InMemoryCollection(dimension, distance, self.vector_dtype)
+            if self.hnsw:
+                collection.enable_hnsw(ef_search=self.hnsw_ef_search)
+            self.collections[collection_name] = collection
     
     async def delete_collection(self, collection_name: str) -> None:
         if collection_name in self.collections:
@@ -435,11 +738,12 @@ class InMemoryVectorStore(VectorStore):
         if collection_name not in self.collections:
             raise ValueError(f"Collection {collection_name} not found")
         
-        for point in points:
-            self.collections[collection_name]["points"][point["id"]] = {
-                "vector": np.array(point["vector"], dtype=np.float32),
-                "payload": point.get("payload", {})
-            }
+        if points:
+            self.collections[collection_name].upsert(
+                [point["id"] for point in points],
+                np.asarray([point["vector"] for point in points], dtype=np.float32),
+                [point.get("payload", {}) for point in points]
+            )
         
         return len(points)
     
@@ -454,32 +758,57 @@ class InMemoryVectorStore(VectorStore):
             return []
         
         collection = self.collections[collection_name]
-        query_vec = np.array(query_vector, dtype=np.float32)
+        if not len(collection) or limit <= 0:
+            return []
+        
+        query_vec = np.asarray(query_vector, dtype=np.float32)
         
         # Normalize query vector
-        query_vec = query_vec / np.linalg.norm(query_vec)
+        norm = np.linalg.norm(query_vec)
+        if norm:
+            query_vec = query_vec / norm
+        
+        if (
+            collection.has_hnsw
+            and not query_filter
+            and len(collection) >= self.hnsw_min_points
+        ):
+            return [
+                VectorSearchResult(
+                    id=collection.ids[row],
+                    score=score,
+                    payload=collection.payloads[row]
+                )
+                for row, score in collection.knn(query_vec, limit)
+            ]
         
-        results = []
-        for point_id, point_data in collection["points"].items():
-            # Apply filters
-            if query_filter and not self._match_filter(point_data["payload"], query_filter):
-                continue
-            
-            # Calculate cosine similarity
-            point_vec = point_data["vector"]
-            point_vec = point_vec / np.linalg.norm(point_vec)
-            score = float(np.dot(query_vec, point_vec))
-            
-            results.append(VectorSearchResult(
-                id=point_id,
-                score=score,
-                payload=point_data["payload"]
-            ))
+        # Cosine similarity со всеми точками сразу (векторы нормализованы при вставке)
+        scores = collection.score(query_vec)
+        
+        # Apply filters
+        candidates = None
+        if query_filter:
+            candidates = np.flatnonzero(collection.filter_mask(query_filter))
+            scores = scores[candidates]
+        
+        # Top-K без сортировки всех точек
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top.sort()
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
         
-        # Sort by score descending
-        results.sort(key=lambda x: x.score, reverse=True)
+        rows = candidates[top] if candidates is not None else top
         
-        return results[:limit]
+        return [
+            VectorSearchResult(
+                id=collection.ids[row],
+                score=float(score),
+                payload=collection.payloads[row]
+            )
+            for row, score in zip(rows.tolist(), scores[top].tolist())
+        ]
     
     async def delete(
         self,
@@ -489,33 +818,8 @@ class InMemoryVectorStore(VectorStore):
         if collection_name not in self.collections:
             return 0
         
-        deleted = 0
-        for id in ids:
-            if id in self.collections[collection_name]["points"]:
-                del self.collections[collection_name]["points"][id]
-                deleted += 1
-        
-        return deleted
-    
-    def _match_filter(self, payload: Dict, query_filter: Dict) -> bool:
-        """Проверка соответствия фильтру"""
-        for condition in query_filter.get("must", []):
-            key = condition.get("key")
-            
-            if "match" in condition:
-                expected = condition["match"]["value"]
-                actual = payload.get(key)
-                if actual != expected:
-                    return False
-            
-            elif "range" in condition:
-                actual = payload.get(key, 0)
-                if "gte" in condition["range"] and actual < condition["range"]["gte"]:
-                    return False
-                if "lte" in condition["range"] and actual > condition["range"]["lte"]:
-                    return False
-        
-        return True
+        collection = self.collections[collection_name]
+        return sum(collection.delete(id) for id in ids)
 
 
 def create_vector_store(
@@ -530,12 +834,19 @@ def create_vector_store(
         **kwargs: параметры для конкретного store
     """
     if store_type == "memory":
-        return InMemoryVectorStore()
+        return InMemoryVectorStore(
+            vector_dtype=kwargs.get("vector_dtype", "float32"),
+            hnsw=kwargs.get("hnsw", False),
+            hnsw_min_points=kwargs.get("hnsw_min_points", 5000),
+            hnsw_ef_search=kwargs.get("hnsw_ef_search", 64)
+        )
     elif store_type == "qdrant":
         return QdrantVectorStore(
             host=kwargs.get("host", "localhost"),
             port=kwargs.get("port", 6333),
-            api_key=kwargs.get("api_key")
+            api_key=kwargs.get("api_key"),
+            int8_quantization=kwargs.get("int8_quantization", True),
+            prefer_grpc=kwargs.get("prefer_grpc", False)
         )
     elif store_type == "redis":
         return RedisVectorStore(kwargs["redis_client"])
@@ -4,6 +4,7 @@ Search модуль - поисковый движок
 from .query_processor import QueryProcessor, NGramGenerator, Stemmer
 from .engine import SearchEngine
 from .indexer import Indexer
+from .cache import RedisCache
 
 __all__ = [
     "QueryProcessor",
@@ -11,4 +12,5 @@ __all__ = [
     "Stemmer",
     "SearchEngine",
     "Indexer",
+    "RedisCache",
 ]
@@ -0,0 +1,122 @@
+"""
+Кэш результатов поиска в Redis
+"""
+import json
+from dataclasses import asdict
+from typing import List, Optional
+
+from ..core.models import Product, SearchResult
+from ..core.interfaces import ICache
+
+
+# Удаляет результаты поиска из объединения множеств зависимостей и сами
+# множества; KEYS - ключи множеств, ARGV[1] - префикс ключей результатов.
+# Выполняется атомарно и за один round-trip.
+_INVALIDATE_SCRIPT = """
+local hashes = redis.call('SUNION', unpack(KEYS))
+local deleted = 0
+for _, query_hash in ipairs(hashes) do
+    deleted = deleted + redis.call('DEL', ARGV[1] .. query_hash)
+end
+redis.call('DEL', unpack(KEYS))
+return deleted
+"""
+
+
+class RedisCache(ICache):
+    """
+    Кэш результатов поиска
+
+    Ключи:
+    - cache:{project_id}:search:{query_hash} - результат поиска (JSON)
+    - cache:{project_id}:dep:{product_id} - query_hash результатов,
+      в которые попал товар
+
+    По множествам зависимостей invalidate_by_products удаляет только
+    результаты с изменёнными товарами - без перебора всего кэша проекта
+    и без сброса кэша целиком.
+    """
+
+    # Сколько товаров инвалидировать одним вызовом скрипта (unpack в Lua
+    # ограничен размером стека)
+    INVALIDATE_BATCH_SIZE = 1000
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._invalidate = redis_client.register_script(_INVALIDATE_SCRIPT)
+
+    @staticmethod
+    def _result_key(project_id: str, query_hash: str) -> str:
+        return f"cache:{project_id}:search:{query_hash}"
+
+    @staticmethod
+    def _dep_key(project_id: str, product_id: str) -> str:
+        return f"cache:{project_id}:dep:{product_id}"
+
+    async def get_search_result(
+        self,
+        project_id: str,
+        query_hash: str
+    ) -> Optional[SearchResult]:
+        """Получить закэшированный результат поиска"""
+        data = await self.redis.get(self._result_key(project_id, query_hash))
+        if not data:
+            return None
+
+        d = json.loads(data)
+        d["items"] = [Product(**item) for item in d["items"]]
+        return SearchResult(**d)
+
+    async def set_search_result(
+        self,
+        project_id: str,
+        query_hash: str,
+        result: SearchResult,
+        ttl: int = 60
+    ) -> None:
+        """
+        Сохранить результат поиска в кэш
+
+        Вместе с результатом для каждого товара из него пополняется
+        множество зависимостей (с тем же TTL).
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(
+            self._result_key(project_id, query_hash),
+            ttl,
+            json.dumps(asdict(result), ensure_ascii=False)
+        )
+        for product in result.items:
+            dep_key = self._dep_key(project_id, product.id)
+            pipe.sadd(dep_key, query_hash)
+            pipe.expire(dep_key, ttl)
+        await pipe.execute()
+
+    async def invalidate_by_products(
+        self,
+        project_id: str,
+        product_ids: List[str]
+    ) -> int:
+        """
+        Инвалидировать кэш для изменённых товаров
+
+        Returns:
+            Количество удалённых записей
+        """
+        deleted = 0
+        prefix = self._result_key(project_id, "")
+
+        for i in range(0, len(product_ids), self.INVALIDATE_BATCH_SIZE):
+            batch = product_ids[i:i + self.INVALIDATE_BATCH_SIZE]
+            deleted += await self._invalidate(
+                keys=[self._dep_key(project_id, pid) for pid in batch],
+                args=[prefix]
+            )
+
+        return deleted
+
+    async def invalidate_project(self, project_id: str) -> None:
+        """Очистить весь кэш проекта"""
+        keys = [key async for key in self.redis.scan_iter(match=f"cache:{project_id}:*")]
+        if keys:
+            await self.redis.delete(*keys)
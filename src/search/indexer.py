@@ -1,14 +1,15 @@
 """
 Индексатор товаров
 """
+import asyncio
 import json
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Optional, Set, Union
 from collections import defaultdict
 from datetime import datetime
 
-from ..core.models import Product
-from ..core.interfaces import IIndexer
-from .query_processor import QueryProcessor, NGramGenerator, Stemmer
+from ..core.models import Product, ProductBatch
+from ..core.interfaces import IIndexer, ICache
+from .query_processor import QueryProcessor, NGramGenerator, Stemmer, TypoDictionary
 
 
 class Indexer(IIndexer):
@@ -22,17 +23,28 @@ class Indexer(IIndexer):
     - Индекс категорий
     """
     
-    def __init__(self, redis_client, config: dict = None):
+    def __init__(
+        self,
+        redis_client,
+        config: dict = None,
+        cache: Optional[ICache] = None,
+        query_processor: Optional[QueryProcessor] = None,
+    ):
         self.redis = redis_client
         self.config = config or {}
-        self.query_processor = QueryProcessor()
+        # Кэш результатов поиска: при изменении товаров сбрасываются только
+        # результаты, в которых они встречаются
+        self.cache = cache
+        # Тот же QueryProcessor, что у SearchEngine: словарь опечаток,
+        # построенный при индексации, должен использоваться при поиске
+        self.query_processor = query_processor or QueryProcessor()
         self.ngram_gen = NGramGenerator(n=3)
         self.stemmer = Stemmer()
     
     async def index_products(
         self,
         project_id: str,
-        products: List[Product]
+        products: Union[ProductBatch, List[Product]]
     ) -> int:
         """
         Полная индексация товаров (атомарная замена)
@@ -116,6 +128,15 @@ class Indexer(IIndexer):
             
             await pipe.execute()
         
+        if self.cache:
+            await self.cache.invalidate_project(project_id)
+        
+        # Словарь опечаток строится по словарю индекса один раз здесь,
+        # а не на каждый поисковый запрос; построение - секунды CPU,
+        # поэтому в потоке, чтобы не блокировать event loop
+        typo_dictionary = await asyncio.to_thread(TypoDictionary, list(inverted_index))
+        self.query_processor.set_typo_dictionary(project_id, typo_dictionary)
+        
         return len(products)
     
     async def update_products(
@@ -136,6 +157,9 @@ class Indexer(IIndexer):
             await self._add_to_index(project_id, product)
             updated += 1
         
+        if self.cache and products:
+            await self.cache.invalidate_by_products(project_id, [p.id for p in products])
+        
         return updated
     
     async def update_stock_prices(
@@ -147,6 +171,7 @@ class Indexer(IIndexer):
         Быстрое обновление остатков и цен (без переиндексации)
         """
         updated = 0
+        changed_ids = []
         
         async with self.redis.pipeline() as pipe:
             for update in updates:
@@ -200,10 +225,14 @@ class Indexer(IIndexer):
                             product_dict["discount_percent"] = None
                     
                     pipe.set(key, json.dumps(product_dict))
+                    changed_ids.append(product_id)
                     updated += 1
             
             await pipe.execute()
         
+        if self.cache and changed_ids:
+            await self.cache.invalidate_by_products(project_id, changed_ids)
+        
         return updated
     
     async def delete_products(
@@ -220,6 +249,9 @@ class Indexer(IIndexer):
             await self._remove_from_index(project_id, product_id)
             deleted += 1
         
+        if self.cache and product_ids:
+            await self.cache.invalidate_by_products(project_id, list(product_ids))
+        
         return deleted
     
     async def clear_index(self, project_id: str) -> None:
@@ -237,6 +269,8 @@ class Indexer(IIndexer):
             keys = await self.redis.keys(pattern)
             if keys:
                 await self.redis.delete(*keys)
+        
+        self.query_processor.drop_typo_dictionary(project_id)
     
     # ==================== Приватные методы ====================
     
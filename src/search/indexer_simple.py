@@ -4,10 +4,10 @@
 import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, Union
 from collections import defaultdict
 
-from ..core.models import Product
+from ..core.models import Product, ProductBatch
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +36,7 @@ class SimpleIndexer:
         self.ngram_gen = ngram_gen
         self.db = db  # PostgreSQL для бэкапа
     
-    async def index_products(self, project_id: str, products: List[Product]) -> int:
+    async def index_products(self, project_id: str, products: Union[ProductBatch, List[Product]]) -> int:
         """Полная индексация товаров"""
         if not products:
             return 0
@@ -95,7 +95,7 @@ class SimpleIndexer:
         
         return len(products)
 
-    def _build_index_data(self, project_id: str, products: List[Product]):
+    def _build_index_data(self, project_id: str, products: Union[ProductBatch, List[Product]]):
         """CPU-bound построение индексов в памяти (вызывается через to_thread)"""
         products_data = {}
         inverted_index = defaultdict(dict)
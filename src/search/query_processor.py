@@ -2,7 +2,8 @@
 Обработчик поисковых запросов
 """
 import re
-from typing import List, Dict, Set, Tuple, Optional
+from collections import OrderedDict
+from typing import List, Dict, Set, Tuple, Optional, Iterable
 from dataclasses import dataclass
 
 from ..core.models import SearchQuery
@@ -25,6 +26,89 @@ DEFAULT_STOPWORDS_RU = {
 }
 
 
+def _levenshtein_distance(s1: str, s2: str) -> int:
+    """
+    Расстояние Левенштейна между двумя строками
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    
+    if len(s2) == 0:
+        return len(s1)
+    
+    previous_row = range(len(s2) + 1)
+    
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            insertions = previous_row[j + 1] + 1
+            deletions = current_row[j] + 1
+            substitutions = previous_row[j] + (c1 != c2)
+            current_row.append(min(insertions, deletions, substitutions))
+        previous_row = current_row
+    
+    return previous_row[-1]
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """
+    Все варианты слова с удалением до max_distance символов (вместе с самим словом)
+    """
+    result = {word}
+    edits = [word]
+    for _ in range(max_distance):
+        next_edits = []
+        for edit in edits:
+            for i in range(len(edit)):
+                variant = edit[:i] + edit[i + 1:]
+                if variant not in result:
+                    result.add(variant)
+                    next_edits.append(variant)
+        edits = next_edits
+    return result
+
+
+class TypoDictionary:
+    """
+    Словарь для исправления опечаток по схеме SymSpell (symmetric delete)
+    
+    Для слов словаря один раз строятся все варианты с удалением до
+    max_distance символов. При поиске удаления строятся только для слова
+    из запроса: кандидаты берутся из индекса удалений и проверяются
+    точным расстоянием Левенштейна - без перебора всего словаря.
+    """
+    
+    def __init__(self, words: Iterable[str], max_distance: int = 2):
+        self.max_distance = max_distance
+        self.words: Set[str] = set(words)
+        self._deletes: Dict[str, List[str]] = {}
+        for word in self.words:
+            for variant in _deletes(word, max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+    
+    def closest(self, word: str) -> Optional[str]:
+        """
+        Ближайшее слово словаря (не дальше max_distance) или None
+        """
+        candidates = set()
+        for variant in _deletes(word, self.max_distance):
+            bucket = self._deletes.get(variant)
+            if bucket:
+                candidates.update(bucket)
+        
+        best = None
+        best_key = None
+        for candidate in candidates:
+            distance = _levenshtein_distance(word, candidate)
+            if distance > self.max_distance:
+                continue
+            key = (distance, candidate)
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        
+        return best
+
+
 class QueryProcessor(IQueryProcessor):
     """
     Обработчик поисковых запросов
@@ -35,6 +119,10 @@ class QueryProcessor(IQueryProcessor):
     3. Удаление стоп-слов
     4. Исправление опечаток
     5. Расширение синонимами
+    
+    Словари опечаток проектов (build_dictionary) держатся в памяти процесса
+    LRU-кэшем не более чем на max_typo_dictionaries проектов: вытесненный
+    проект исправляется через dictionary_getter до следующей индексации.
     """
     
     def __init__(
@@ -42,10 +130,14 @@ class QueryProcessor(IQueryProcessor):
         stopwords: Set[str] = None,
         synonyms_getter=None,  # Функция для получения синонимов
         dictionary_getter=None,  # Функция для получения словаря (для опечаток)
+        max_typo_dictionaries: int = 16,
     ):
         self.stopwords = stopwords or DEFAULT_STOPWORDS_RU
         self.synonyms_getter = synonyms_getter
         self.dictionary_getter = dictionary_getter
+        self.max_typo_dictionaries = max_typo_dictionaries
+        # Словари опечаток, построенные при индексации: {project_id: TypoDictionary}
+        self._typo_dictionaries: "OrderedDict[str, TypoDictionary]" = OrderedDict()
     
     def process(self, query: str, project_id: str) -> SearchQuery:
         """
@@ -61,7 +153,7 @@ class QueryProcessor(IQueryProcessor):
         corrected = False
         original_tokens = tokens.copy()
         
-        if self.dictionary_getter:
+        if self.dictionary_getter or project_id in self._typo_dictionaries:
             tokens = self.fix_typos(tokens, project_id)
             corrected = tokens != original_tokens
         
@@ -113,14 +205,48 @@ class QueryProcessor(IQueryProcessor):
         
         return tokens
     
+    def build_dictionary(self, project_id: str, tokens: Iterable[str]) -> None:
+        """
+        Построение словаря опечаток проекта (индекс удалений SymSpell)
+        """
+        self.set_typo_dictionary(project_id, TypoDictionary(tokens))
+    
+    def set_typo_dictionary(self, project_id: str, typo_dictionary: TypoDictionary) -> None:
+        """
+        Установка готового словаря опечаток проекта
+        
+        Позволяет построить TypoDictionary вне event loop (в потоке),
+        а зарегистрировать - в нём. Самый давно не использованный словарь
+        вытесняется сверх max_typo_dictionaries.
+        """
+        self._typo_dictionaries[project_id] = typo_dictionary
+        self._typo_dictionaries.move_to_end(project_id)
+        while len(self._typo_dictionaries) > self.max_typo_dictionaries:
+            self._typo_dictionaries.popitem(last=False)
+    
+    def drop_typo_dictionary(self, project_id: str) -> None:
+        """Удаление словаря опечаток проекта"""
+        self._typo_dictionaries.pop(project_id, None)
+    
     def fix_typos(self, tokens: List[str], project_id: str) -> List[str]:
         """
         Исправление опечаток с помощью расстояния Левенштейна
+        
+        Если для проекта построен словарь (build_dictionary), кандидаты
+        ищутся по индексу удалений; иначе - перебором словаря из
+        dictionary_getter.
         """
-        if not self.dictionary_getter:
+        typo_dictionary = self._typo_dictionaries.get(project_id)
+        if typo_dictionary is not None:
+            self._typo_dictionaries.move_to_end(project_id)
+            dictionary = typo_dictionary.words
+            find_closest = typo_dictionary.closest
+        elif self.dictionary_getter:
+            dictionary = self.dictionary_getter(project_id)
+            find_closest = lambda word: self._find_closest_word(word, dictionary)
+        else:
             return tokens
         
-        dictionary = self.dictionary_getter(project_id)
         if not dictionary:
             return tokens
         
@@ -137,7 +263,7 @@ class QueryProcessor(IQueryProcessor):
                 continue
             
             # Ищем ближайшее слово
-            best_match = self._find_closest_word(token, dictionary)
+            best_match = find_closest(token)
             fixed.append(best_match if best_match else token)
         
         return fixed
@@ -173,33 +299,17 @@ class QueryProcessor(IQueryProcessor):
         """
         Расстояние Левенштейна между двумя строками
         """
-        if len(s1) < len(s2):
-            s1, s2 = s2, s1
-        
-        if len(s2) == 0:
-            return len(s1)
-        
-        previous_row = range(len(s2) + 1)
-        
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-        
-        return previous_row[-1]
+        return _levenshtein_distance(s1, s2)
     
     def expand_synonyms(self, tokens: List[str], project_id: str) -> List[List[str]]:
         """
         Расширение токенов синонимами
         
         Возвращает список списков, где каждый внутренний список
-        содержит токен и его синонимы
+        содержит токен и его синонимы (одна группа на токен, без
+        перебора комбинаций)
         """
-        if not self.synonyms_getter:
+        if not tokens or not self.synonyms_getter:
             return [[t] for t in tokens]
         
         synonyms_dict = self.synonyms_getter(project_id)
@@ -208,11 +318,9 @@ class QueryProcessor(IQueryProcessor):
         
         expanded = []
         for token in tokens:
-            if token in synonyms_dict:
-                # Токен + все его синонимы
-                expanded.append([token] + synonyms_dict[token])
-            else:
-                expanded.append([token])
+            # Токен + все его синонимы - один поиск в словаре на токен
+            synonyms = synonyms_dict.get(token)
+            expanded.append([token, *synonyms] if synonyms else [token])
         
         return expanded
 